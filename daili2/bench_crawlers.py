@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from requests.adapters import HTTPAdapter
+
+from proxy_manager import ProxyCrawler, HTML_PARSER
+
+# 录制的页面按代理源分目录保存: fixtures/<代理源>/index.json 记录 地址 -> 文件、状态码、内容类型，
+# 以及录制时解析出的代理数，回放时数量变化说明解析逻辑或页面结构有变。
+# 按网站页面结构手写、不是真实录制的页面在 index.json 中标记 "synthetic": true
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+class FixtureStore:
+    """读写某个代理源录制的页面"""
+    def __init__(self, root, source):
+        self.directory = os.path.join(root, source)
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.index = {"pages": {}, "proxy_count": None, "synthetic": False}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def exists(self):
+        return bool(self.index["pages"])
+
+    def synthetic(self):
+        return self.index.get("synthetic", False)
+
+    def save_page(self, url, status, content_type, body):
+        content_type = content_type or "application/octet-stream"
+        extension = ".json" if "json" in content_type else ".html" if "html" in content_type else ".txt"
+        name = hashlib.sha1(url.encode()).hexdigest()[:12] + extension
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(body)
+        self.index["pages"][url] = {"file": name, "status": status, "content_type": content_type}
+
+    def save_index(self, proxy_count):
+        self.index["proxy_count"] = proxy_count
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+
+    def load_pages(self):
+        """返回 {地址: (状态码, 内容类型, 内容)}"""
+        pages = {}
+        for url, page in self.index["pages"].items():
+            with open(os.path.join(self.directory, page["file"]), "rb") as f:
+                pages[url] = (page["status"], page["content_type"], f.read())
+        return pages
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """本地替身服务: 路径中是原始地址，返回录制的内容"""
+    pages = {}
+
+    def do_GET(self):
+        page = self.pages.get(unquote(self.path[1:]))
+        if page is None:
+            self.send_error(404)
+            return
+        status, content_type, body = page
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ReplayAdapter(HTTPAdapter):
+    """把爬虫的请求改写到本地替身服务，并统计花在请求上的时间"""
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+        self.fetch_time = 0.0
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        request.url = f"{self.base_url}/{quote(original_url, safe='')}"
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        response.content
+        self.fetch_time += time.perf_counter() - started
+        response.url = original_url
+        return response
+
+class RecordAdapter(HTTPAdapter):
+    """正常访问代理网站，同时把响应保存为录制页面"""
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        self.store.save_page(request.url, response.status_code, response.headers.get("Content-Type"), response.content)
+        return response
+
+def make_crawler(source, proxy_type, parser, adapter, errors=None):
+    """创建爬虫，所有请求经过 adapter。给出 errors 列表时收集出错的日志，
+    部分爬虫每解析出一个代理都会输出一条日志，这些不算错误"""
+    crawler = ProxyCrawler(source, proxy_type, parser=parser)
+    if errors is not None:
+        crawler.log_signal.connect(lambda message: errors.append(message) if "出错" in message else None)
+
+    def get_direct_session():
+        session = ProxyCrawler.get_direct_session(crawler)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    crawler.get_direct_session = get_direct_session
+    return crawler
+
+def measure_memory(crawler, method):
+    """单独运行一次，返回 (峰值内存, 分配块数)。分配块数是爬取方法返回前仍占用的内存块数，
+    即本次爬取分配、还没有释放的页面内容、解析树和结果"""
+    code = getattr(ProxyCrawler, method).__code__
+    blocks = []
+
+    def profile(frame, event, arg):
+        if event == "return" and frame.f_code is code:
+            blocks.append(sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename")))
+
+    tracemalloc.start()
+    sys.setprofile(profile)
+    try:
+        getattr(crawler, method)()
+    finally:
+        sys.setprofile(None)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak, max(blocks, default=0)
+
+def record(sources, fixtures, proxy_type, parser):
+    """录制各代理源的页面，返回没能录制的代理源。访问出错或没有解析出代理时不保存，原有的录制页面保持不变"""
+    failed = []
+    for source in sources:
+        store = FixtureStore(fixtures, source)
+        store.index = {"pages": {}, "proxy_count": None, "synthetic": False}
+        errors = []
+        crawler = make_crawler(source, proxy_type, parser, RecordAdapter(store), errors)
+        proxies = getattr(crawler, ProxyCrawler.SOURCES[source][1])()
+        print(f"{source}: 录制 {len(store.index['pages'])} 个页面，解析出 {len(proxies)} 个代理"
+              + (f"，{len(errors)} 条错误: {errors[0]}" if errors else ""))
+        if errors or not proxies:
+            failed.append(source)
+            continue
+        store.save_index(len(proxies))
+    return failed
+
+def start_stand_in():
+    """启动本地替身服务，返回 (服务, 地址)，回放的页面放在 StandInHandler.pages 中"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def measure_source(source, proxy_type, parser, repeat, base_url):
+    """用替身服务中的页面运行代理源的爬取方法，返回 (代理列表, 错误日志, 最短解析用时, 峰值内存, 分配块数)"""
+    method = ProxyCrawler.SOURCES[source][1]
+
+    # 先运行一次检查结果和错误，计时的几次不连接日志信号，用时中不包含处理日志的时间
+    errors = []
+    proxies = getattr(make_crawler(source, proxy_type, parser, ReplayAdapter(base_url), errors), method)()
+
+    # 解析用时取 repeat 次中最短的一次，扣除请求替身服务的时间
+    best = float("inf")
+    for _ in range(repeat):
+        adapter = ReplayAdapter(base_url)
+        crawler = make_crawler(source, proxy_type, parser, adapter)
+        started = time.perf_counter()
+        getattr(crawler, method)()
+        best = min(best, time.perf_counter() - started - adapter.fetch_time)
+
+    # 峰值内存和分配块数单独运行一次统计
+    peak, blocks = measure_memory(make_crawler(source, proxy_type, parser, ReplayAdapter(base_url)), method)
+    return proxies, errors, best, peak, blocks
+
+def replay(sources, fixtures, proxy_type, parser, repeat):
+    """回放录制的页面并输出统计，返回 (没有录制页面的代理源, 使用手写页面的代理源)"""
+    missing = []
+    synthetic = []
+    server, base_url = start_stand_in()
+
+    print(f"解析器: {parser}")
+    print(f"{'代理源':<22} {'代理数':>6} {'录制时':>6} {'解析用时(ms)':>12} {'代理/秒':>10} {'峰值内存(KB)':>13} "
+          f"{'分配块数':>8}  状态")
+    try:
+        for source in sources:
+            store = FixtureStore(fixtures, source)
+            if not store.exists():
+                print(f"{source:<22} 无录制页面，先用 --record 录制")
+                missing.append(source)
+                continue
+            if store.synthetic():
+                synthetic.append(source)
+            StandInHandler.pages = store.load_pages()
+            proxies, errors, best, peak, blocks = measure_source(source, proxy_type, parser, repeat, base_url)
+
+            expected = store.index.get("proxy_count")
+            if errors:
+                status = f"出错: {errors[0]}"
+            elif expected is not None and len(proxies) != expected:
+                status = f"代理数与录制时不同（{expected}）"
+            else:
+                status = "正常"
+            if store.synthetic():
+                status += "（手写页面）"
+            rate = len(proxies) / best if best > 0 else 0
+            print(f"{source:<22} {len(proxies):>6} {expected if expected is not None else '-':>6} "
+                  f"{best * 1000:>12.1f} {rate:>10.0f} {peak / 1024:>13.1f} {blocks:>8}  {status}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return missing, synthetic
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="用录制的页面离线测试各代理源的解析速度和结果")
+    parser.add_argument("--record", action="store_true", help="访问代理网站并录制页面，而不是回放")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="录制页面的目录")
+    parser.add_argument("--sources", default=",".join(ProxyCrawler.SOURCES), help="代理源，用逗号分隔")
+    parser.add_argument("--proxy-type", default="socks5", help="爬取的代理类型")
+    parser.add_argument("--parser", default=HTML_PARSER, help="页面解析器，例如 lxml、html.parser")
+    parser.add_argument("--repeat", type=int, default=5, help="每个代理源重复解析的次数")
+    args = parser.parse_args()
+
+    sources = [name.strip() for name in args.sources.split(",") if name.strip()]
+    unknown = [name for name in sources if name not in ProxyCrawler.SOURCES]
+    if unknown:
+        parser.error(f"未知的代理源: {', '.join(unknown)}")
+    if args.record:
+        failed = record(sources, args.fixtures, args.proxy_type, args.parser)
+        if failed:
+            print(f"\n未能录制的代理源（{len(failed)}/{len(sources)}）: {', '.join(failed)}")
+    else:
+        missing, synthetic = replay(sources, args.fixtures, args.proxy_type, args.parser, args.repeat)
+        if synthetic:
+            print(f"\n使用手写页面、不是真实录制的代理源（{len(synthetic)}/{len(sources)}）: {', '.join(synthetic)}")
+        if missing:
+            print(f"\n缺少录制页面、没有测试的代理源（{len(missing)}/{len(sources)}）: {', '.join(missing)}")
@@ -0,0 +1,66 @@
+import argparse
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from bench_crawlers import DEFAULT_FIXTURES, FixtureStore, StandInHandler, start_stand_in, measure_source
+from proxy_manager import ProxyCrawler
+
+# 参与比较的 BeautifulSoup 解析器，爬虫通过 make_soup 使用其中之一
+BACKENDS = ["lxml", "html.parser"]
+
+def backend_available(backend):
+    """make_soup 在解析器不可用时会退回 html.parser，比较前先确认解析器确实可用"""
+    try:
+        BeautifulSoup("", backend)
+    except FeatureNotFound:
+        return False
+    return True
+
+def run_benchmark(sources, fixtures, backends, proxy_type, repeat):
+    """对每个有录制页面的代理源，分别用各解析器运行爬虫的解析逻辑，返回没有录制页面的代理源"""
+    available = []
+    for backend in backends:
+        if backend_available(backend):
+            available.append(backend)
+        else:
+            print(f"解析器 {backend} 未安装，跳过")
+
+    missing = []
+    server, base_url = start_stand_in()
+    print(f"{'代理源':<22} {'解析器':<12} {'代理数':>6} {'解析用时(ms)':>12} {'峰值内存(KB)':>13} {'分配块数':>8}  状态")
+    try:
+        for source in sources:
+            store = FixtureStore(fixtures, source)
+            if not store.exists():
+                missing.append(source)
+                continue
+            StandInHandler.pages = store.load_pages()
+            for backend in available:
+                proxies, errors, best, peak, blocks = measure_source(source, proxy_type, backend, repeat, base_url)
+                status = f"出错: {errors[0]}" if errors else "正常"
+                if store.synthetic():
+                    status += "（手写页面）"
+                print(f"{source:<22} {backend:<12} {len(proxies):>6} {best * 1000:>12.1f} {peak / 1024:>13.1f} "
+                      f"{blocks:>8}  {status}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return missing
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="用录制的页面比较爬取代理网站时各页面解析器的用时和内存")
+    parser.add_argument("--sources", default=",".join(ProxyCrawler.SOURCES), help="代理源，用逗号分隔")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="录制页面的目录，用 bench_crawlers.py --record 录制")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="参与比较的解析器，用逗号分隔")
+    parser.add_argument("--proxy-type", default="socks5", help="爬取的代理类型")
+    parser.add_argument("--repeat", type=int, default=5, help="每个代理源重复解析的次数")
+    args = parser.parse_args()
+
+    sources = [name.strip() for name in args.sources.split(",") if name.strip()]
+    unknown = [name for name in sources if name not in ProxyCrawler.SOURCES]
+    if unknown:
+        parser.error(f"未知的代理源: {', '.join(unknown)}")
+    missing = run_benchmark(sources, args.fixtures, [name.strip() for name in args.backends.split(",") if name.strip()],
+                            args.proxy_type, args.repeat)
+    if missing:
+        print(f"\n缺少录制页面、没有比较的代理源（{len(missing)}/{len(sources)}）: {', '.join(missing)}")
@@ -7,7 +7,7 @@ import PyInstaller.__main__
 
 datas = [('proxies.db', '.'), ('down_arrow.png', '.')]
 binaries = []
-hiddenimports = ['PyQt5.sip', 'requests', 'bs4', 'socks', 'sqlite3', 'concurrent.futures', 'threading', 'queue', 'warnings', 'time', 'socket', 'json', 're', 'os', 'sys']
+hiddenimports = ['PyQt5.sip', 'requests', 'bs4', 'lxml', 'socks', 'sqlite3', 'concurrent.futures', 'threading', 'queue', 'warnings', 'time', 'socket', 'json', 're', 'os', 'sys']
 tmp_ret = collect_all('PyQt5')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 tmp_ret = collect_all('socks')
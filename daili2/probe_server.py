@@ -0,0 +1,58 @@
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认返回的标记，验证设置中的"响应标记"需与之一致
+DEFAULT_TOKEN = "proxy-ok"
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    """轻量探测地址: /generate_204 返回空的 204，/headers 以 JSON 回显收到的请求头和来源地址，
+    其余路径返回一个短标记"""
+    token = DEFAULT_TOKEN
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/generate_204"):
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path.startswith("/headers"):
+            # 检测代理匿名级别用: 透明代理会在请求头中带上客户端IP，匿名代理会带上 Via 等请求头
+            body = json.dumps({"headers": dict(self.headers.items()),
+                               "remote_addr": self.client_address[0]}).encode()
+            content_type = "application/json"
+        else:
+            body = self.token.encode()
+            content_type = "text/plain"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 验证时请求量很大，不逐条打印访问日志
+        pass
+
+def run_server(host="0.0.0.0", port=8204, token=DEFAULT_TOKEN):
+    ProbeHandler.token = token
+    server = ThreadingHTTPServer((host, port), ProbeHandler)
+    server.daemon_threads = True
+    print(f"探测服务已启动: http://{host}:{port}/  (204 地址: /generate_204，请求头回显: /headers，标记: {token})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="代理验证使用的轻量探测服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8204, help="监听端口")
+    parser.add_argument("--token", default=DEFAULT_TOKEN, help="返回的标记")
+    args = parser.parse_args()
+    run_server(args.host, args.port, args.token)
@@ -1,27 +1,106 @@
 import sys
 import os
 import re
+import json
+import argparse
+import subprocess
 import sqlite3
 import threading
 import time
+import bisect
+import math
+import errno
+import hmac
+import ipaddress
 import socket
 import socks
 import requests
+from requests.adapters import HTTPAdapter
 import concurrent.futures
+import asyncio
+import multiprocessing
 import warnings
-from queue import Queue
-from bs4 import BeautifulSoup
+from itertools import islice
+from urllib.parse import urlsplit
+from queue import Queue, Empty, Full
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque, Counter
+from bs4 import BeautifulSoup, FeatureNotFound
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QListWidget, QPushButton, QLabel, QMessageBox, QMenu, QAction,
-                            QProgressBar, QComboBox, QTabWidget, QTextEdit, QSplitter, QSpinBox, QLineEdit, QDialog, QDialogButtonBox, QFileDialog)
+                            QProgressBar, QComboBox, QTabWidget, QTextEdit, QSplitter, QSpinBox, QLineEdit, QDialog, QDialogButtonBox, QFileDialog,
+                            QFormLayout, QCheckBox, QDoubleSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QMetaObject, Q_ARG
 from PyQt5.QtGui import QCursor, QColor
-import winreg
+# 工作节点可以运行在非 Windows 主机上，没有 winreg 时无法设置系统代理
+try:
+    import winreg
+except ImportError:
+    winreg = None
 import ctypes
+# 解析代理网站页面时优先使用更快的 lxml，没有安装时退回标准库的 html.parser
+try:
+    import lxml
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
 # 抑制 PyQt5 的弃用警告
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# 验证代理时访问的测试网站
+DEFAULT_TEST_URLS = [
+    "http://www.baidu.com",
+    "http://www.qq.com",
+    "http://www.163.com",
+    "http://www.sohu.com",
+    "http://www.sina.com.cn"
+]
+# 识别协议和 HTTP 代理握手时 CONNECT 的目标，必须是监听 443 端口的 TLS 网站，
+# 不能取自测试地址: 自建的探测服务通常只提供明文 HTTP，CONNECT 会失败，支持隧道的代理也只能识别为 http
+DEFAULT_CONNECT_TARGET = "www.baidu.com:443"
+# 匿名级别及显示名称: 透明代理泄露本机IP，匿名代理暴露了代理身份，高匿代理两者都不泄露
+ANONYMITY_NAMES = {"elite": "高匿", "anonymous": "匿名", "transparent": "透明"}
+# 代理转发请求时常添加、能暴露代理身份或客户端IP的请求头
+PROXY_HEADERS = ("via", "x-forwarded-for", "forwarded", "forwarded-for", "x-forwarded", "x-real-ip",
+                 "client-ip", "x-client-ip", "x-originating-ip", "true-client-ip", "proxy-client-ip",
+                 "wl-proxy-client-ip", "proxy-connection", "x-proxy-id", "x-bluecoat-via")
+# 检测匿名级别时读取的回显响应体上限
+ANONYMITY_BODY_BYTES = 16 * 1024
+# 爬取代理时每个请求的超时，以及爬取所有源时的总时限（秒）
+CRAWL_TIMEOUT = 15
+CRAWL_DEADLINE = 60
+# 测试选中代理时所有检查的总时限（秒）
+DEEP_TEST_DEADLINE = 15
+# 至少成功访问的网站数，达到后才认为代理有效
+MIN_SUCCESS_COUNT = 2
+# 每次探测最多读取的响应体字节数
+MAX_BODY_BYTES = 1024
+# 连续失败达到 DEAD_FAIL_STREAK 次的代理视为长期失效，验证数据库时只抽样 DEAD_SAMPLE_RATIO 比例复查，
+# 后台监控复查时连续失败达到 MAX_FAIL_STREAK 次的代理从数据库删除
+DEAD_FAIL_STREAK = 3
+DEAD_SAMPLE_RATIO = 0.2
+MAX_FAIL_STREAK = 8
+# 后台监控: 每 MONITOR_TICK 秒检查一次到期的代理，每轮最多复查 MONITOR_BATCH 个。
+# 有效的代理每 MONITOR_HEALTHY_INTERVAL 秒复查一次，失败的代理从 MONITOR_RETRY_BASE 秒开始
+# 按连续失败次数指数退避，最长 MONITOR_RETRY_CAP 秒
+MONITOR_TICK = 30
+MONITOR_BATCH = 200
+MONITOR_HEALTHY_INTERVAL = 10 * 60
+MONITOR_RETRY_BASE = 5 * 60
+MONITOR_RETRY_CAP = 6 * 60 * 60
+# 爬取-验证流水线中等待验证的代理数上限，队列满时爬虫暂停
+PIPELINE_QUEUE_SIZE = 1000
+# processes 引擎每次分给工作进程的代理数
+SHARD_CHUNK_SIZE = 500
+# distributed 引擎: 每个租约包含的代理数，以及多久没有汇报结果就收回重新分配（秒）
+LEASE_SIZE = 200
+LEASE_TIMEOUT = 60
+# 线程引擎的线程数上限，异步引擎不受此限制
+MAX_THREAD_WORKERS = 50
+# 自动识别协议时可能得到的代理类型，https 表示支持 CONNECT 隧道的 HTTP 代理
+PROXY_PROTOCOLS = ["socks5", "socks4", "socks4a", "http", "https"]
+
 # 数据库操作类
 class DatabaseManager:
     def __init__(self, db_path="proxies.db"):
@@ -42,6 +121,15 @@ class DatabaseManager:
             is_valid INTEGER DEFAULT 1
         )
         ''')
+        
+        # 旧数据库补充验证历史字段: 验证次数、连续失败次数、最近一次有效的时间、被设为系统代理的次数
+        cursor.execute('PRAGMA table_info(proxies)')
+        columns = {row[1] for row in cursor.fetchall()}
+        for name, definition in (("check_count", "INTEGER DEFAULT 0"), ("fail_streak", "INTEGER DEFAULT 0"),
+                                 ("last_success", "TIMESTAMP"), ("use_count", "INTEGER DEFAULT 0"),
+                                 ("anonymity", "TEXT")):
+            if name not in columns:
+                cursor.execute(f'ALTER TABLE proxies ADD COLUMN {name} {definition}')
         conn.commit()
         conn.close()
     
@@ -70,6 +158,26 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def add_proxies(self, proxies):
+        """批量添加代理 [(ip, port, protocol, response_time), ...]，已存在的跳过，返回新增的数量"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        inserted_count = 0
+        try:
+            for ip, port, protocol, response_time in proxies:
+                cursor.execute('SELECT id FROM proxies WHERE ip = ? AND port = ? AND protocol = ?', (ip, port, protocol))
+                if cursor.fetchone():
+                    continue
+                cursor.execute('''
+                INSERT INTO proxies (ip, port, protocol, response_time, last_checked)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (ip, port, protocol, response_time))
+                inserted_count += 1
+            conn.commit()
+        finally:
+            conn.close()
+        return inserted_count
+    
     def deduplicate_proxies(self):
         """删除数据库中的重复代理"""
         conn = sqlite3.connect(self.db_path)
@@ -83,7 +191,9 @@ class DatabaseManager:
         cursor.execute('''
         CREATE TEMPORARY TABLE temp_proxies AS
         SELECT MIN(id) as id, ip, port, protocol, MAX(response_time) as response_time,
-               MAX(last_checked) as last_checked, MAX(is_valid) as is_valid
+               MAX(last_checked) as last_checked, MAX(is_valid) as is_valid,
+               MAX(check_count) as check_count, MIN(fail_streak) as fail_streak,
+               MAX(last_success) as last_success, SUM(use_count) as use_count, MAX(anonymity) as anonymity
         FROM proxies
         GROUP BY ip, port, protocol
         ''')
@@ -93,8 +203,10 @@ class DatabaseManager:
         
         # 从临时表恢复数据
         cursor.execute('''
-        INSERT INTO proxies (id, ip, port, protocol, response_time, last_checked, is_valid)
-        SELECT id, ip, port, protocol, response_time, last_checked, is_valid
+        INSERT INTO proxies (id, ip, port, protocol, response_time, last_checked, is_valid,
+                             check_count, fail_streak, last_success, use_count, anonymity)
+        SELECT id, ip, port, protocol, response_time, last_checked, is_valid,
+               check_count, fail_streak, last_success, use_count, anonymity
         FROM temp_proxies
         ''')
         
@@ -110,14 +222,113 @@ class DatabaseManager:
         
         return removed_count
     
-    def get_all_proxies(self):
+    def get_all_proxies(self, anonymity=None):
+        """返回有效的代理，指定 anonymity 时只返回该匿名级别的代理"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT ip, port, protocol, response_time FROM proxies WHERE is_valid = 1')
+        if anonymity:
+            cursor.execute('SELECT ip, port, protocol, response_time FROM proxies WHERE is_valid = 1 AND anonymity = ?',
+                           (anonymity,))
+        else:
+            cursor.execute('SELECT ip, port, protocol, response_time FROM proxies WHERE is_valid = 1')
         proxies = cursor.fetchall()
         conn.close()
         return proxies
     
+    def get_proxies_by_priority(self, dead_streak=DEAD_FAIL_STREAK, dead_sample_ratio=DEAD_SAMPLE_RATIO):
+        """按验证价值排序返回待验证的代理: 最近有效、延迟低、常用的在前，
+        长期失效的只随机抽取一部分排在最后。返回 (代理列表, 跳过的长期失效代理数)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT ip, port, protocol, response_time FROM proxies
+        WHERE fail_streak < ?
+        ORDER BY (CASE WHEN is_valid = 1 THEN 100 ELSE 0 END)
+                 + 10 * MIN(use_count, 10)
+                 - 2 * MIN(COALESCE(response_time, 10), 10)
+                 - 20 * fail_streak
+                 - 5 * MIN(COALESCE(julianday('now') - julianday(last_success), 30), 30) DESC
+        ''', (dead_streak,))
+        proxies = cursor.fetchall()
+        
+        cursor.execute('SELECT COUNT(*) FROM proxies WHERE fail_streak >= ?', (dead_streak,))
+        dead_count = cursor.fetchone()[0]
+        sample_count = math.ceil(dead_count * dead_sample_ratio)
+        cursor.execute('''
+        SELECT ip, port, protocol, response_time FROM proxies
+        WHERE fail_streak >= ?
+        ORDER BY RANDOM() LIMIT ?
+        ''', (dead_streak, sample_count))
+        proxies += cursor.fetchall()
+        conn.close()
+        return proxies, dead_count - sample_count
+    
+    def get_recent_checks(self):
+        """返回验证过的代理的最近结果 [(ip, port, protocol, is_valid, response_time, 距今秒数), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT ip, port, protocol, is_valid, response_time, (julianday('now') - julianday(last_checked)) * 86400
+        FROM proxies WHERE check_count > 0 AND last_checked IS NOT NULL
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+    
+    def get_due_proxies(self, healthy_interval=MONITOR_HEALTHY_INTERVAL, retry_base=MONITOR_RETRY_BASE,
+                        retry_cap=MONITOR_RETRY_CAP, limit=MONITOR_BATCH):
+        """返回到了复查时间的代理 [(ip, port, protocol, response_time), ...]，超期最久的在前。
+        有效的代理每 healthy_interval 秒复查一次，连续失败的代理间隔按 retry_base 翻倍，最长 retry_cap 秒"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT ip, port, protocol, response_time, fail_streak,
+               COALESCE((julianday('now') - julianday(last_checked)) * 86400, 1e9)
+        FROM proxies
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        due = []
+        for ip, port, protocol, response_time, fail_streak, age in rows:
+            if fail_streak:
+                interval = min(retry_base * 2 ** min(fail_streak - 1, 30), retry_cap)
+            else:
+                interval = healthy_interval
+            if age >= interval:
+                due.append((age - interval, (ip, port, protocol, response_time)))
+        due.sort(key=lambda entry: entry[0], reverse=True)
+        return [proxy for _, proxy in due[:limit]]
+    
+    def prune_dead_proxies(self, max_fail_streak=MAX_FAIL_STREAK):
+        """删除连续失败次数达到上限的代理，返回删除的数量"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM proxies WHERE fail_streak >= ?', (max_fail_streak,))
+        removed_count = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed_count
+    
+    def update_proxy_anonymity_batch(self, results):
+        """批量保存匿名级别，results 为 [(ip, port, 匿名级别), ...]，返回数据库中更新的代理数"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE proxies SET anonymity = ? WHERE ip = ? AND port = ?',
+                           [(level, ip, port) for ip, port, level in results])
+        updated_count = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return updated_count
+    
+    def record_proxy_use(self, ip, port):
+        """代理被设为系统代理时计数，常用的代理验证时优先"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('UPDATE proxies SET use_count = use_count + 1 WHERE ip = ? AND port = ?', (ip, port))
+        conn.commit()
+        conn.close()
+    
     def get_proxies_by_type(self, protocol):
         """获取指定类型的代理"""
         conn = sqlite3.connect(self.db_path)
@@ -134,216 +345,2249 @@ class DatabaseManager:
         conn.commit()
         conn.close()
     
+    def delete_proxies(self, proxies):
+        """删除指定的代理，proxies 为 [(ip, port), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM proxies WHERE ip = ? AND port = ?', proxies)
+        conn.commit()
+        conn.close()
+    
+    def update_proxy_protocol_batch(self, protocols):
+        """在一个事务中更新多个自动识别出的代理协议，protocols 为 [(ip, port, protocol), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('''
+        UPDATE proxies 
+        SET protocol = ?
+        WHERE ip = ? AND port = ?
+        ''', [(protocol, ip, port) for ip, port, protocol in protocols])
+        conn.commit()
+        conn.close()
+    
     def update_proxy_status(self, ip, port, is_valid, response_time=None):
+        self.update_proxy_status_batch([(ip, port, is_valid, response_time)])
+    
+    def update_proxy_status_batch(self, results):
+        """在一个事务中更新多个代理的状态，results 为 [(ip, port, is_valid, response_time), ...]"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.executemany('''
         UPDATE proxies 
-        SET is_valid = ?, response_time = ?, last_checked = CURRENT_TIMESTAMP
+        SET is_valid = ?, response_time = ?, last_checked = CURRENT_TIMESTAMP,
+            check_count = check_count + 1,
+            fail_streak = CASE WHEN ? THEN 0 ELSE fail_streak + 1 END,
+            last_success = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE last_success END
         WHERE ip = ? AND port = ?
-        ''', (is_valid, response_time, ip, port))
+        ''', [(is_valid, response_time, is_valid, is_valid, ip, port) for ip, port, is_valid, response_time in results])
         conn.commit()
         conn.close()
 
+# 探测延迟统计，保留最近的样本，用于计算分位数
+class LatencyTracker:
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = deque()
+        self.sorted_samples = []
+        self.lock = threading.Lock()
+    
+    def add(self, value):
+        with self.lock:
+            self.samples.append(value)
+            bisect.insort(self.sorted_samples, value)
+            # 超出窗口时移除最早的样本
+            if len(self.samples) > self.window:
+                oldest = self.samples.popleft()
+                del self.sorted_samples[bisect.bisect_left(self.sorted_samples, oldest)]
+    
+    def count(self):
+        return len(self.samples)
+    
+    def percentile(self, q):
+        """返回分位数，q 取 0~1，没有样本时返回 None"""
+        with self.lock:
+            if not self.sorted_samples:
+                return None
+            index = min(len(self.sorted_samples) - 1, int(q * len(self.sorted_samples)))
+            return self.sorted_samples[index]
+
+# threads 引擎: 工作线程验证一个代理期间连接的套接字登记在 probe_sockets.sockets 中，
+# 由 DeadlineWatchdog 在超过时间预算时关闭。套接字由 requests/urllib3 在内部创建，通过审计事件得到。
+# 审计钩子无法移除，因此只在第一次创建看门狗时安装，没有看门狗在运行时钩子立即返回
+probe_sockets = threading.local()
+probe_hook_installed = False
+active_watchdogs = 0
+probe_hook_lock = threading.Lock()
+
+def track_probe_socket(event, args):
+    if not active_watchdogs or event != "socket.connect":
+        return
+    sockets = getattr(probe_sockets, "sockets", None)
+    if sockets is not None:
+        sockets.append(args[0])
+
+def count_watchdog(delta):
+    """登记运行中的看门狗数量，第一次使用时安装审计钩子"""
+    global probe_hook_installed, active_watchdogs
+    with probe_hook_lock:
+        if not probe_hook_installed:
+            sys.addaudithook(track_probe_socket)
+            probe_hook_installed = True
+        active_watchdogs += delta
+
+class DeadlineWatchdog:
+    """到期时关闭登记的套接字，阻塞中的连接、读取响应头和响应体都会立即返回，
+    慢速滴流数据的代理也不能占用工作线程超过时间预算"""
+    def __init__(self):
+        self.entries = {}
+        self.next_id = 0
+        self.running = True
+        self.condition = threading.Condition()
+        # 停止后仍在进行的探测由看门狗继续限制时间，线程退出时才停止登记套接字
+        count_watchdog(1)
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def watch(self, deadline_at, sockets):
+        """登记套接字列表（之后加入的套接字同样有效），返回用于取消的编号"""
+        with self.condition:
+            self.next_id += 1
+            self.entries[self.next_id] = (deadline_at, sockets)
+            self.condition.notify()
+            return self.next_id
+    
+    def cancel(self, watch_id):
+        with self.condition:
+            self.entries.pop(watch_id, None)
+    
+    def stop(self):
+        """不再接受新的登记，已登记的套接字到期后照常关闭，之后线程退出"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+    
+    def run(self):
+        try:
+            self.watch_entries()
+        finally:
+            count_watchdog(-1)
+    
+    def watch_entries(self):
+        with self.condition:
+            while self.running or self.entries:
+                now = time.monotonic()
+                for watch_id, (deadline_at, sockets) in list(self.entries.items()):
+                    if deadline_at <= now:
+                        del self.entries[watch_id]
+                        for sock in sockets:
+                            try:
+                                sock.shutdown(socket.SHUT_RDWR)
+                            except OSError:
+                                pass
+                next_deadline = min((deadline_at for deadline_at, _ in self.entries.values()), default=now + 1)
+                self.condition.wait(max(0.0, next_deadline - now))
+
+# 说明本机资源不足的套接字错误，出现时应降低并发
+LOCAL_SOCKET_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL, errno.EADDRINUSE}
+
+# 并发数自动调节 (AIMD): 超时率和本机套接字错误正常、吞吐量没有下降时逐步加大并发，
+# 超时率比基线明显升高或出现本机套接字错误时按比例减小。
+# 超时率只统计存活代理（至少访问成功一个网站）的探测，死代理的超时与并发无关
+class ConcurrencyController:
+    def __init__(self, initial, minimum, maximum, step=None, backoff=0.5, interval=1.0, min_samples=50,
+                 timeout_spike=0.15, local_error_ratio=0.01):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(maximum, initial))
+        self.step = step or max(1, maximum // 20)
+        self.backoff = backoff
+        self.interval = interval
+        self.min_samples = min_samples
+        self.timeout_spike = timeout_spike
+        self.local_error_ratio = local_error_ratio
+        # 列表中的死代理本身就会超时，以超时率的滑动平均作为基线，明显高于基线才算异常
+        self.baseline = None
+        self.last_throughput = None
+        # 刚降低并发后，在途的请求还是按原并发发出的，跳过一个周期再判断
+        self.settling = False
+        # 开始的几个周期里死代理的超时还没出现，基线偏低，只根据本机套接字错误降低并发
+        self.warmup_windows = 3
+        self.windows = 0
+        self.counts = {"ok": 0, "fail": 0, "timeout": 0, "local": 0, "dead": 0}
+        self.window_started = time.monotonic()
+        self.history = [(0.0, self.limit)]
+        self.started = self.window_started
+        self.lock = threading.Lock()
+    
+    def record(self, outcome):
+        """记录一次探测的结果: ok、fail、timeout、local（本机套接字错误）或 dead（死代理的探测）"""
+        with self.lock:
+            self.counts[outcome] += 1
+    
+    def adjust(self):
+        """统计周期结束时调整并发，调整了返回 (新并发, 原因)，否则返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            elapsed = now - self.window_started
+            total = sum(self.counts.values())
+            alive = self.counts["ok"] + self.counts["fail"] + self.counts["timeout"]
+            if elapsed < self.interval or total < self.min_samples:
+                return None
+            timeout_ratio = self.counts["timeout"] / alive if alive else 0.0
+            local_ratio = self.counts["local"] / total
+            throughput = total / elapsed
+            self.counts = {key: 0 for key in self.counts}
+            self.window_started = now
+            if self.settling:
+                self.settling = False
+                self.last_throughput = throughput
+                return None
+            
+            baseline = timeout_ratio if self.baseline is None else self.baseline
+            self.baseline = baseline + (timeout_ratio - baseline) * 0.2
+            self.windows += 1
+            # 样本少时超时率波动大，允许的偏差取三倍标准差
+            allowed = max(self.timeout_spike, baseline * 0.5, 3 * math.sqrt(baseline * (1 - baseline) / max(alive, 1)))
+            
+            if local_ratio >= self.local_error_ratio:
+                limit = max(self.minimum, int(self.limit * self.backoff))
+                reason = f"本机套接字错误 {local_ratio:.0%}"
+            elif self.windows > self.warmup_windows and timeout_ratio > baseline + allowed:
+                limit = max(self.minimum, int(self.limit * self.backoff))
+                reason = f"超时率 {timeout_ratio:.0%}，基线 {baseline:.0%}"
+            elif self.last_throughput is not None and throughput < self.last_throughput * 0.8:
+                # 吞吐量下降时保持不变，等下个周期再判断
+                limit = self.limit
+                reason = None
+            else:
+                limit = min(self.maximum, self.limit + self.step)
+                reason = f"超时率 {timeout_ratio:.0%}，吞吐量 {throughput:.0f} 次/秒"
+            self.last_throughput = throughput
+            
+            if limit == self.limit:
+                return None
+            self.settling = limit < self.limit
+            self.limit = limit
+            self.history.append((now - self.started, limit))
+            return limit, reason
+
+# 测试网站健康统计: 某个网站在大量"能访问其他网站"的代理上都失败时，说明是网站本身出了问题，
+# 暂时停用该网站，冷却后先少量试探，恢复正常再重新启用
+class TargetHealth:
+    def __init__(self, urls, window=50, min_samples=20, trip_ratio=0.8, cooldown=30, probe_samples=5):
+        self.urls = list(urls)
+        self.min_samples = min_samples
+        self.trip_ratio = trip_ratio
+        self.cooldown = cooldown
+        self.probe_samples = probe_samples
+        self.samples = {url: deque(maxlen=window) for url in self.urls}
+        # 停用中的网站及其恢复时间，冷却结束后进入试探状态
+        self.open_until = {}
+        self.half_open = set()
+        self.trip_count = 0
+        self.lock = threading.Lock()
+    
+    def active_targets(self):
+        """当前参与验证的测试网站"""
+        now = time.monotonic()
+        with self.lock:
+            for url, until in list(self.open_until.items()):
+                if now >= until:
+                    del self.open_until[url]
+                    self.half_open.add(url)
+                    self.samples[url].clear()
+            return [url for url in self.urls if url not in self.open_until]
+    
+    def record(self, outcomes):
+        """记录一个代理对各网站的访问结果 {url: 是否成功}，返回状态变化的说明。
+        代理一个网站都访问不了时不计入，失败更可能是代理本身的问题"""
+        if not any(outcomes.values()):
+            return []
+        
+        events = []
+        with self.lock:
+            for url, success in outcomes.items():
+                if url in self.open_until:
+                    continue
+                samples = self.samples[url]
+                samples.append(success)
+                failure_ratio = samples.count(False) / len(samples)
+                
+                if url in self.half_open:
+                    if len(samples) < self.probe_samples:
+                        continue
+                    self.half_open.discard(url)
+                    if failure_ratio >= self.trip_ratio and len(self.urls) - len(self.open_until) > 1:
+                        self.trip(url)
+                        events.append(f"测试网站 {url} 试探仍然失败，继续停用 {self.cooldown} 秒")
+                    elif failure_ratio >= self.trip_ratio:
+                        # 至少保留一个测试网站
+                        events.append(f"测试网站 {url} 试探仍然失败，但它是唯一可用的测试网站，继续使用")
+                    else:
+                        events.append(f"测试网站 {url} 已恢复，重新启用")
+                elif (len(samples) >= self.min_samples and failure_ratio >= self.trip_ratio
+                        and len(self.urls) - len(self.open_until) > 1):
+                    # 至少保留一个测试网站
+                    events.append(f"测试网站 {url} 最近 {len(samples)} 次访问失败率 {failure_ratio:.0%}，"
+                                  f"暂停使用 {self.cooldown} 秒")
+                    self.trip(url)
+        return events
+    
+    def trip(self, url):
+        self.open_until[url] = time.monotonic() + self.cooldown
+        self.samples[url].clear()
+        self.trip_count += 1
+
+# 验证结果缓存: 有效和无效的结果分别在各自的有效期内视为新鲜，验证时直接复用，不再探测
+# 结果按验证设置的指纹 (协议, 测试网站, 校验内容) 分开保存，换了协议或测试网站后不会用到之前的结果，
+# 指纹由 ProxyVerifier.cache_fingerprint 给出
+class VerificationCache:
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        # 早于这个时间的数据库记录不再载入，测试网站等设置改变后由 reset 更新
+        self.since = 0.0
+    
+    def reset(self):
+        """清空缓存，之前在数据库中记录的验证结果也不再使用"""
+        with self.lock:
+            self.entries.clear()
+            self.since = time.time()
+    
+    def store(self, fingerprint, results):
+        """记录刚验证完的结果 [(ip, port, is_valid, response_time), ...]"""
+        checked_at = time.time()
+        with self.lock:
+            for ip, port, is_valid, response_time in results:
+                self.entries[(fingerprint, ip, port)] = (bool(is_valid), response_time, checked_at)
+    
+    def load(self, fingerprint, rows):
+        """从数据库的验证记录 [(ip, port, protocol, is_valid, response_time, 距今秒数), ...] 补充缓存，
+        只载入协议与指纹相符、在 reset 之后验证的记录，并只保留较新的结果"""
+        protocol = fingerprint[0]
+        now = time.time()
+        with self.lock:
+            for ip, port, row_protocol, is_valid, response_time, age in rows:
+                checked_at = now - age
+                if checked_at < self.since or protocol in PROXY_PROTOCOLS and row_protocol != protocol:
+                    continue
+                key = (fingerprint, ip, port)
+                entry = self.entries.get(key)
+                if entry is None or entry[2] < checked_at:
+                    self.entries[key] = (bool(is_valid), response_time, checked_at)
+    
+    def lookup(self, fingerprint, ip, port, good_ttl, dead_ttl):
+        """结果仍新鲜时返回 (is_valid, response_time)，没有记录或已过期返回 None，有效期单位为秒"""
+        entry = self.entries.get((fingerprint, ip, port))
+        if entry is None:
+            return None
+        is_valid, response_time, checked_at = entry
+        if time.time() - checked_at >= (good_ttl if is_valid else dead_ttl):
+            return None
+        return is_valid, response_time
+
+# 爬取-验证流水线: 爬虫放入的代理去重后进入有界队列，队列满时爬虫等待，验证器边取边验证
+class ProxyPipeline:
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE):
+        self.queue = Queue(maxsize=maxsize)
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.accepted = 0
+        self.duplicates = 0
+    
+    def put(self, proxy):
+        """放入一个代理，重复的直接丢弃，队列满时等待；流水线已关闭时返回 False"""
+        with self.lock:
+            if (proxy[0], proxy[1]) in self.seen:
+                self.duplicates += 1
+                return True
+            self.seen.add((proxy[0], proxy[1]))
+        while not self.closed:
+            try:
+                self.queue.put(proxy, timeout=0.2)
+            except Full:
+                continue
+            with self.lock:
+                self.accepted += 1
+            return True
+        return False
+    
+    def finish(self):
+        """爬取结束，放入结束标记"""
+        while not self.closed:
+            try:
+                self.queue.put(None, timeout=0.2)
+                return
+            except Full:
+                continue
+    
+    def get_nowait(self):
+        """取出一个代理，爬取结束时返回 None，队列暂时为空时抛出 Empty"""
+        return self.queue.get_nowait()
+    
+    def close(self):
+        """验证结束或被停止时调用，正在等待的爬虫不再阻塞"""
+        self.closed = True
+
+# 分布式验证的租约管理: 把代理分批租给工作节点，汇报结果即续租，超时未汇报的批次收回重新分配
+class LeaseCoordinator:
+    def __init__(self, proxies, lease_size=LEASE_SIZE, lease_timeout=LEASE_TIMEOUT):
+        self.proxies = iter(proxies)
+        self.exhausted = False
+        self.lease_size = lease_size
+        self.lease_timeout = lease_timeout
+        # lease_id -> {"worker", "pending": {(ip, port): 代理}, "expires"}
+        self.leases = {}
+        # 尚未得到结果的代理 (ip, port) -> 所在租约，收回的代理为 None
+        self.outstanding = {}
+        # 工作节点汇报的结果只有 ip 和端口，同一 ip:port 同时只分配一个代理: current 为正在验证的那个，
+        # 其他协议的同一代理在 waiting 中排队，前一个得到结果后再分配
+        self.current = {}
+        self.waiting = {}
+        self.requeued = deque()
+        self.next_id = 1
+        self.stopped = False
+        self.lock = threading.Lock()
+    
+    def lease(self, worker):
+        """为工作节点分配一批代理，返回 (lease_id, 代理列表)；暂时没有可分配的返回 (None, [])，
+        全部完成返回 None"""
+        with self.lock:
+            if self.stopped:
+                return None
+            batch = []
+            while self.requeued and len(batch) < self.lease_size:
+                proxy = self.requeued.popleft()
+                if self.outstanding.get(proxy[:2], False) is None and self.current.get(proxy[:2]) == proxy:
+                    batch.append(proxy)
+            keys = {proxy[:2] for proxy in batch}
+            while not self.exhausted and len(batch) < self.lease_size:
+                proxy = next(self.proxies, None)
+                if proxy is None:
+                    self.exhausted = True
+                    break
+                proxy = tuple(proxy)
+                if proxy[:2] in self.outstanding or proxy[:2] in keys:
+                    self.waiting.setdefault(proxy[:2], deque()).append(proxy)
+                    continue
+                batch.append(proxy)
+                keys.add(proxy[:2])
+            if not batch:
+                return None if self.exhausted and not self.outstanding else (None, [])
+            
+            lease_id = self.next_id
+            self.next_id += 1
+            self.leases[lease_id] = {"worker": worker, "pending": {proxy[:2]: proxy for proxy in batch},
+                                     "expires": time.monotonic() + self.lease_timeout}
+            for proxy in batch:
+                self.outstanding[proxy[:2]] = lease_id
+                self.current[proxy[:2]] = proxy
+            return lease_id, batch
+    
+    def report(self, lease_id, results, final=False):
+        """接收工作节点汇报的结果，返回第一次得到的结果，重复汇报的忽略"""
+        accepted = []
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is not None:
+                lease["expires"] = time.monotonic() + self.lease_timeout
+            for result in results:
+                key = (result[0], result[1])
+                if key not in self.outstanding:
+                    continue
+                owner = self.outstanding.pop(key)
+                del self.current[key]
+                if owner in self.leases:
+                    self.leases[owner]["pending"].pop(key, None)
+                accepted.append(result)
+                # 同一 ip:port 的下一个代理可以分配了
+                if key in self.waiting:
+                    proxy = self.waiting[key].popleft()
+                    if not self.waiting[key]:
+                        del self.waiting[key]
+                    self.outstanding[key] = None
+                    self.current[key] = proxy
+                    self.requeued.append(proxy)
+            if final and lease is not None:
+                # 工作节点已结束这个租约，没有汇报结果的代理重新分配
+                self.requeue(lease_id)
+        return accepted
+    
+    def expire(self):
+        """收回超时的租约，返回 [(lease_id, 工作节点, 收回的代理数), ...]"""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for lease_id, lease in list(self.leases.items()):
+                if lease["expires"] <= now:
+                    expired.append((lease_id, lease["worker"], self.requeue(lease_id)))
+        return expired
+    
+    def requeue(self, lease_id):
+        lease = self.leases.pop(lease_id)
+        for key, proxy in lease["pending"].items():
+            self.outstanding[key] = None
+            self.requeued.append(proxy)
+        return len(lease["pending"])
+    
+    def finished(self):
+        with self.lock:
+            return self.stopped or (self.exhausted and not self.outstanding)
+    
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+
+def is_loopback_host(host):
+    """监听地址是否只能从本机访问，空地址、0.0.0.0 和其他主机名都按可从外部访问处理"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# 协调节点的 HTTP 接口: POST /lease 领取一批代理，POST /report 汇报结果
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        verifier = self.server.verifier
+        token = self.headers.get("X-Worker-Token", "")
+        if verifier.worker_token and not hmac.compare_digest(token.encode(), verifier.worker_token.encode()):
+            self.send_json(403, {"error": "token"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "json"})
+            return
+        
+        if self.path == "/lease":
+            self.send_json(200, verifier.handle_lease(request))
+        elif self.path == "/report":
+            self.send_json(200, verifier.handle_report(request))
+        else:
+            self.send_json(404, {"error": "path"})
+    
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
 # 代理验证线程
 class ProxyVerifier(QThread):
     update_signal = pyqtSignal(str, int, bool, float)
     progress_signal = pyqtSignal(int)
     finished_signal = pyqtSignal()
     log_signal = pyqtSignal(str)
+    # 自动识别出的协议与列表中记录的不同时发出
+    # 批量发送识别出的协议 [(ip, port, protocol), ...]
+    protocol_signal = pyqtSignal(list)
+    # 批量发送的验证结果 [(ip, port, is_valid, response_time), ...] 和日志
+    batch_signal = pyqtSignal(list)
+    log_batch_signal = pyqtSignal(list)
+    # 自动调节并发时，当前的并发数
+    concurrency_signal = pyqtSignal(int)
+    # 命中缓存直接复用的结果，格式同 batch_signal，界面据此显示但不更新验证时间
+    cached_signal = pyqtSignal(list)
     
-    def __init__(self, proxy_list, max_workers=10, proxy_type="socks5"):
+    def __init__(self, proxy_list, max_workers=10, proxy_type="socks5", engine="asyncio", timeout=5,
+                 quorum=True, prefilter=True, tcp_limit=1000, handshake_limit=500, detect_protocol=False,
+                 deadline=10, adaptive_timeout=False, timeout_factor=3.0, timeout_floor=1.0,
+                 adaptive_min_samples=50, batch_size=200, batch_interval_ms=200, total=None, window=None,
+                 test_urls=None, expect_token="", max_body_bytes=MAX_BODY_BYTES, circuit_breaker=True,
+                 auto_concurrency=False, min_concurrency=5, processes=None,
+                 coordinator_host="127.0.0.1", coordinator_port=8765, local_workers=2, worker_token="",
+                 cache=None, cache_good_ttl=10, cache_dead_ttl=60, anonymity_url="", pipeline=None,
+                 stored_protocol=False, connect_target=DEFAULT_CONNECT_TARGET):
         super().__init__()
+        # proxy_list 可以是列表，也可以是只遍历一次的迭代器，验证时按需取出，
+        # 同时在途的任务数不超过 window，内存占用与列表长度无关
         self.proxy_list = proxy_list
+        # 爬取-验证流水线: 设置后从 pipeline 中边爬边取代理，只支持异步引擎
+        self.pipeline = pipeline
+        if pipeline is not None:
+            engine = "asyncio"
         self.max_workers = max_workers
         self.proxy_type = proxy_type
+        self.engine = engine
+        self.timeout = timeout
+        # 快速判定: 有效/无效结论确定后不再访问剩余的测试网站
+        self.quorum = quorum
+        # 分阶段验证: TCP连接 -> 代理握手 -> HTTP内容检查，各阶段单独限流
+        self.prefilter = prefilter
+        self.stage_limits = {"tcp": tcp_limit, "handshake": handshake_limit, "http": max_workers}
+        self.stage_stats = {stage: {"pass": 0, "fail": 0} for stage in self.stage_limits}
+        # 自动识别每个代理的协议，而不是统一使用 proxy_type
+        self.detect_protocol = detect_protocol
+        # 验证数据库中的代理时，每个代理使用数据库中记录的协议
+        self.stored_protocol = stored_protocol
+        # 单个代理的总时间预算，覆盖连接、握手和读取响应，超出即终止
+        self.deadline = deadline
+        self.deadline_killed = 0
+        # 自适应超时: 样本足够后，超时收缩到成功探测延迟 p95 的 timeout_factor 倍，
+        # 并限制在 timeout_floor 和 timeout 之间
+        self.adaptive_timeout = adaptive_timeout
+        self.timeout_factor = timeout_factor
+        self.timeout_floor = timeout_floor
+        self.adaptive_min_samples = adaptive_min_samples
+        self.latency = LatencyTracker()
+        # 批量发送: 累计 batch_size 个结果，或各引擎的调度循环中距上次发送超过 batch_interval_ms 毫秒时一起发给界面
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval_ms / 1000
+        self.pending_results = []
+        self.pending_logs = []
+        self.pending_protocols = []
+        self.last_flush = time.monotonic()
+        self.last_progress = -1
+        self.batch_results = False
+        self.batch_logs = False
+        # 测试地址可换成返回 204 或短标记的轻量地址（见 probe_server.py），
+        # 设置了 expect_token 时响应体中必须包含该标记才算访问成功
+        self.test_urls = list(test_urls or DEFAULT_TEST_URLS)
+        self.expect_token = expect_token
+        self.max_body_bytes = max_body_bytes
+        self.traffic = {"sent": 0, "received": 0}
+        # 熔断: 自动停用大面积失败的测试网站，有效所需的成功数随可用网站数调整
+        self.circuit_breaker = circuit_breaker
+        self.target_health = TargetHealth(self.test_urls)
+        # 自动调节并发: 同时在途的代理数在 min_concurrency 和 max_workers 之间按 AIMD 调整，
+        # threads 引擎的上限还受线程数限制
+        self.auto_concurrency = auto_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = None
+        # processes 引擎的工作进程数，每个进程运行一个 asyncio 验证器，并发上限平均分配
+        self.processes = processes or os.cpu_count() or 1
+        # distributed 引擎: 本机作为协调节点监听 coordinator_host:coordinator_port，
+        # 并启动 local_workers 个本地工作进程，其他主机可用 --worker 参数加入
+        self.coordinator_host = coordinator_host
+        self.coordinator_port = coordinator_port
+        self.local_workers = local_workers
+        self.worker_token = worker_token
+        self.coordinator = None
+        # 验证结果缓存: 有效结果 cache_good_ttl 分钟、无效结果 cache_dead_ttl 分钟内不重复验证，为 0 时不复用
+        self.cache = cache
+        self.cache_good_ttl = cache_good_ttl * 60
+        self.cache_dead_ttl = cache_dead_ttl * 60
+        self.cache_hits = {"good": 0, "dead": 0}
+        self.pending_cached = []
+        # 回显请求头的地址，只在检测匿名级别时使用
+        self.anonymity_url = anonymity_url
+        # 识别 https 代理和 HTTP 代理握手时 CONNECT 的目标 主机:端口
+        self.connect_target = connect_target
         self.is_running = True
+        # 用户中途停止时置为 True，界面据此只处理已经验证过的代理
+        self.cancelled = False
         self.verified_count = 0
-        self.total_count = len(proxy_list)
+        # 迭代器没有长度，由 total 给出总数用于计算进度，未给出时不发送进度
+        self.total_count = len(proxy_list) if hasattr(proxy_list, "__len__") else (total or 0)
+        # 默认窗口为并发上限的两倍，分阶段验证时按各阶段上限之和计算，保证每个阶段都能排满
+        if window is None:
+            window = 2 * (sum(self.stage_limits.values()) if prefilter and engine == "asyncio" else max_workers)
+        self.window = window
         self.lock = threading.Lock()
+        # 停止时用于中断进行中的探测: asyncio 引擎的事件循环和总任务，threads 引擎正在读取的响应
+        self.loop = None
+        self.main_task = None
+        self.active_responses = set()
+        # threads 引擎的时间预算看门狗，在 run_threads 中创建
+        self.watchdog = None
+        # threads 引擎每个工作线程复用一个 Session；两种引擎都统计连接复用情况
+        self.thread_local = threading.local()
+        self.sessions = []
+        self.pool_stats = {"connections": 0, "requests": 0}
     
     def run(self):
-        self.log_signal.emit(f"开始多线程验证代理，使用 {self.max_workers} 个线程，代理类型: {self.proxy_type}")
+        try:
+            # 只向已连接的信号发送，未连接批量信号时保持逐条发送
+            self.batch_results = self.receivers(self.batch_signal) > 0
+            self.batch_logs = self.receivers(self.log_batch_signal) > 0
+            self.target_health = TargetHealth(self.test_urls)
+            if self.auto_concurrency and self.engine not in ("processes", "distributed"):
+                maximum = self.max_workers if self.engine == "asyncio" else min(self.max_workers, MAX_THREAD_WORKERS)
+                minimum = min(self.min_concurrency, maximum)
+                self.concurrency = ConcurrencyController(max(minimum, maximum // 4), minimum, maximum)
+                self.concurrency_signal.emit(self.concurrency.limit)
+            if self.cache is not None and (self.cache_good_ttl > 0 or self.cache_dead_ttl > 0):
+                self.proxy_list = self.skip_cached(self.proxy_list)
+        
+            if self.engine == "asyncio":
+                self.run_asyncio()
+            elif self.engine == "processes":
+                self.run_processes()
+            elif self.engine == "distributed":
+                self.run_coordinator()
+            else:
+                self.run_threads()
+        
+            if self.cancelled:
+                total = f"/{self.total_count}" if self.total_count else ""
+                self.log(f"验证已停止，已完成 {self.verified_count}{total} 个代理")
+            if self.deadline_killed:
+                self.log(f"共有 {self.deadline_killed} 个代理超过 {self.deadline} 秒时间预算被终止验证")
+            # processes 和 distributed 引擎的延迟统计由各工作进程分别输出
+            if self.adaptive_timeout and self.engine not in ("processes", "distributed"):
+                self.log_latency_stats()
+            self.log_traffic_stats()
+            if self.cache_hits["good"] or self.cache_hits["dead"]:
+                hits = self.cache_hits["good"] + self.cache_hits["dead"]
+                self.log(f"缓存命中 {hits} 个代理（有效 {self.cache_hits['good']}，无效 {self.cache_hits['dead']}），"
+                         f"实际验证 {self.verified_count - hits} 个")
+            if self.concurrency is not None:
+                history = "，".join(f"{elapsed:.0f}秒:{limit}" for elapsed, limit in self.concurrency.history[-20:])
+                self.log(f"并发调整记录: {history}")
+            if self.target_health.trip_count:
+                disabled = [url for url in self.test_urls if url not in self.target_health.active_targets()]
+                self.log(f"测试网站熔断 {self.target_health.trip_count} 次，结束时仍停用: {', '.join(disabled) or '无'}")
+        except Exception as e:
+            # 引擎中未预料的异常也要结束验证，否则界面一直停在验证中
+            self.log(f"验证过程中出错，验证已结束: {str(e)}")
+        finally:
+            if self.pipeline is not None:
+                self.pipeline.close()
+            self.flush()
+            self.finished_signal.emit()
+    
+    def log(self, message):
+        """发送日志，连接了批量日志信号时先缓存，随结果一起发送"""
+        if self.batch_logs:
+            with self.lock:
+                self.pending_logs.append(message)
+        else:
+            self.log_signal.emit(message)
+    
+    def report_protocols(self, protocols):
+        """缓存识别出的协议 [(ip, port, protocol), ...]，随结果一起批量发送"""
+        with self.lock:
+            self.pending_protocols.extend(protocols)
+    
+    def flush_if_due(self):
+        """距上次发送超过 batch_interval 时发送缓存的结果，由各引擎的调度循环定时调用。
+        只在验证线程中发送，工作进程中的验证器没有事件循环，其他线程发出的信号不会送达"""
+        if time.monotonic() - self.last_flush >= self.batch_interval:
+            self.flush()
+    
+    async def flush_periodically_async(self):
+        """asyncio 引擎的发送定时器，探测结果出得慢时界面也能及时更新"""
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            self.flush_if_due()
+    
+    def flush(self):
+        """把缓存的结果和日志一次性发给界面"""
+        with self.lock:
+            results, self.pending_results = self.pending_results, []
+            logs, self.pending_logs = self.pending_logs, []
+            cached, self.pending_cached = self.pending_cached, []
+            protocols, self.pending_protocols = self.pending_protocols, []
+        self.last_flush = time.monotonic()
+        if logs:
+            self.log_batch_signal.emit(logs)
+        if protocols:
+            self.protocol_signal.emit(protocols)
+        if cached:
+            self.cached_signal.emit(cached)
+        if results:
+            self.batch_signal.emit(results)
+    
+    def current_timeout(self):
+        """单次探测的超时时间，自适应模式下随成功探测的延迟变化"""
+        if not self.adaptive_timeout or self.latency.count() < self.adaptive_min_samples:
+            return self.timeout
+        cutoff = self.latency.percentile(0.95) * self.timeout_factor
+        return max(self.timeout_floor, min(self.timeout, cutoff))
+    
+    def current_window(self, default):
+        """同时在途的代理数上限，自动调节并发时使用当前的并发数"""
+        if self.concurrency is not None:
+            return self.concurrency.limit
+        return default
+    
+    def record_outcomes(self, kinds):
+        """把一个代理各次探测的结果 {url: 类型} 交给并发调节，一个网站都没访问成功的按死代理计"""
+        if self.concurrency is None:
+            return
+        alive = "ok" in kinds.values()
+        for kind in kinds.values():
+            self.concurrency.record(kind if alive or kind == "local" else "dead")
+    
+    @staticmethod
+    def classify_error(error):
+        """把探测异常归类为 timeout、local（本机套接字错误）或 fail"""
+        # requests 会把底层异常层层包装，逐层查看原因
+        for _ in range(10):
+            if error is None:
+                break
+            if isinstance(error, (asyncio.TimeoutError, TimeoutError, requests.exceptions.Timeout, socket.timeout)):
+                return "timeout"
+            if isinstance(error, OSError) and error.errno in LOCAL_SOCKET_ERRNOS:
+                return "local"
+            wrapped = [arg for arg in error.args if isinstance(arg, BaseException)]
+            error = getattr(error, "reason", None) or error.__cause__ or error.__context__ or (wrapped[0] if wrapped else None)
+        return "fail"
+    
+    def tune_concurrency(self):
+        """在调度循环中定期调用，按最近的探测结果调整并发"""
+        if self.concurrency is None:
+            return
+        change = self.concurrency.adjust()
+        if change:
+            limit, reason = change
+            self.log(f"并发调整为 {limit}（{reason}）")
+            self.concurrency_signal.emit(limit)
+    
+    def count_traffic(self, sent, received):
+        with self.lock:
+            self.traffic["sent"] += sent
+            self.traffic["received"] += received
+    
+    def log_traffic_stats(self):
+        sent, received = self.traffic["sent"], self.traffic["received"]
+        per_proxy = (sent + received) / self.verified_count if self.verified_count else 0
+        self.log(f"流量统计: 发送 {sent / 1024:.1f} KB，接收 {received / 1024:.1f} KB，"
+                             f"平均每个代理 {per_proxy:.0f} 字节")
+    
+    def log_latency_stats(self):
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        if p50 is None:
+            self.log("自适应超时: 没有成功的探测样本，始终使用固定超时")
+            return
+        self.log(f"自适应超时: 样本 {self.latency.count()} 个，p50 {p50:.2f}秒，p95 {p95:.2f}秒，"
+                             f"最终超时 {self.current_timeout():.2f}秒")
+    
+    def run_threads(self):
+        """使用线程池验证，每个线程同步等待 requests 返回"""
+        max_workers = min(self.max_workers, MAX_THREAD_WORKERS)
+        self.log(f"开始多线程验证代理，使用 {max_workers} 个线程，代理类型: {self.proxy_type}")
+        if self.detect_protocol:
+            self.log("threads 引擎不支持自动识别协议，将使用列表中记录的代理类型")
+        
+        # 使用线程池进行并发验证，停止时不等待进行中的线程，由它们在超时后自行退出
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.watchdog = DeadlineWatchdog()
+        default_window = max(self.window, max_workers)
+        try:
+            # 按需提交验证任务，同时在途的任务不超过 window 个，处理可能包含三个值的代理元组
+            proxies = iter(self.proxy_list)
+            future_to_proxy = {}
+            while self.is_running:
+                for proxy in proxies:
+                    future = executor.submit(self.verify_proxy, proxy[0], proxy[1], self.proxy_protocol(proxy))
+                    future_to_proxy[future] = proxy[:2]
+                    if len(future_to_proxy) >= self.current_window(default_window):
+                        break
+                if not future_to_proxy:
+                    break
+                
+                # 处理完成的任务，定时醒来检查是否已停止
+                done, _ = concurrent.futures.wait(
+                    future_to_proxy, timeout=0.2, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    ip, port = future_to_proxy.pop(future)
+                    if not self.is_running:
+                        continue
+                    try:
+                        is_valid, response_time = future.result()
+                        self.report_result(ip, port, is_valid, response_time)
+                    except Exception as e:
+                        self.log(f"验证代理 {ip}:{port} 时出错: {str(e)}")
+                self.tune_concurrency()
+                self.flush_if_due()
+        finally:
+            # 丢弃排队中还未开始的任务，进行中的任务仍由看门狗限制时间
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.watchdog.stop()
+        
+        for session in self.sessions:
+            session.close()
+        reused = self.pool_stats["requests"] - self.pool_stats["connections"]
+        self.log(f"连接池统计: 会话 {len(self.sessions)} 个，请求 {self.pool_stats['requests']} 次，"
+                             f"新建连接 {self.pool_stats['connections']} 次，复用连接 {reused} 次")
+    
+    def run_asyncio(self):
+        """使用单个事件循环验证，同时在途的探测数由 max_workers 限制"""
+        proxy_type = "自动识别" if self.detect_protocol else self.proxy_type
+        self.log(f"开始异步验证代理，并发上限 {self.max_workers}，代理类型: {proxy_type}")
         
-        # 使用线程池进行并发验证
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有验证任务，处理可能包含三个值的代理元组
-            future_to_proxy = {executor.submit(self.verify_proxy, proxy[0], proxy[1]): proxy[:2] 
-                             for proxy in self.proxy_list}
-            
-            # 处理完成的任务
-            for future in concurrent.futures.as_completed(future_to_proxy):
-                if not self.is_running:
-                    executor.shutdown(wait=False)
+        loop = asyncio.new_event_loop()
+        try:
+            self.main_task = loop.create_task(self.verify_all_async())
+            flusher = loop.create_task(self.flush_periodically_async())
+            self.loop = loop
+            try:
+                loop.run_until_complete(self.main_task)
+            except asyncio.CancelledError:
+                self.log("验证已停止，进行中的探测已取消")
+            except Exception as e:
+                self.log(f"异步验证出错，已结束: {str(e)}")
+            finally:
+                flusher.cancel()
+                loop.run_until_complete(asyncio.wait([flusher]))
+        finally:
+            self.loop = None
+            loop.close()
+        
+        if self.prefilter:
+            self.log_stage_stats()
+        reused = self.pool_stats["requests"] - self.pool_stats["connections"]
+        self.log(f"连接复用统计: 请求 {self.pool_stats['requests']} 次，"
+                 f"新建连接 {self.pool_stats['connections']} 次，复用连接 {reused} 次")
+    
+    def run_processes(self):
+        """使用多个工作进程验证，代理按块分发给空闲的进程，结果通过队列实时传回"""
+        processes = max(1, self.processes)
+        self.log(f"开始多进程验证代理，使用 {processes} 个进程，每个进程并发上限 "
+                 f"{max(1, self.max_workers // processes)}，代理类型: {self.proxy_type}")
+        
+        # Qt 程序中 fork 不安全，各平台统一使用 spawn
+        context = multiprocessing.get_context("spawn")
+        task_queue = context.Queue(maxsize=processes * 2)
+        result_queue = context.Queue()
+        stop_event = context.Event()
+        options = self.worker_options(processes)
+        workers = [context.Process(target=verify_shard_worker,
+                                   args=(index + 1, task_queue, result_queue, stop_event, options), daemon=True)
+                   for index in range(processes)]
+        for worker in workers:
+            worker.start()
+        
+        proxies = iter(self.proxy_list)
+        chunk = None
+        sentinels = 0
+        stop_deadline = None
+        # 已分发还没被取走的块 {块编号: 代理}，以及各进程取走后还没有结果的代理
+        shards = {}
+        chunk_count = 0
+        unfinished = {index + 1: Counter() for index in range(processes)}
+        done = set()
+        try:
+            while len(done) < len(workers):
+                if not self.is_running and stop_deadline is None:
+                    # 通知工作进程停止，最多等待1秒让它们交回已有的结果
+                    stop_event.set()
+                    stop_deadline = time.monotonic() + 1
+                if stop_deadline is not None and time.monotonic() >= stop_deadline:
                     break
                 
-                ip, port = future_to_proxy[future]
+                # 分发代理，队列满时先去处理结果，不会阻塞
+                while self.is_running and sentinels < len(workers):
+                    if chunk is None:
+                        chunk = [tuple(proxy) for proxy in islice(proxies, SHARD_CHUNK_SIZE)] or False
+                    try:
+                        task_queue.put_nowait((chunk_count, chunk) if chunk else None)
+                    except Full:
+                        break
+                    if chunk is False:
+                        sentinels += 1
+                    else:
+                        shards[chunk_count] = chunk
+                        chunk_count += 1
+                        chunk = None
+                
+                self.flush_if_due()
                 try:
-                    is_valid, response_time = future.result()
-                    
-                    # 确保response_time是有效的浮点数
-                    if response_time is None:
-                        response_time = 0.0
-                    
-                    self.update_signal.emit(ip, port, is_valid, response_time)
-                    
-                    # 更新进度
+                    kind, worker_id, payload = result_queue.get(timeout=0.1)
+                except Empty:
+                    # 队列已取空，退出了却没有发来 done 的进程是意外退出的
+                    self.check_dead_workers(workers, done, unfinished)
+                    continue
+                if kind == "taken":
+                    unfinished[worker_id].update(proxy[:2] for proxy in shards.pop(payload, []))
+                elif kind == "results":
+                    for result in payload:
+                        if unfinished[worker_id][result[:2]] > 0:
+                            unfinished[worker_id][result[:2]] -= 1
+                        self.report_result(*result)
+                elif kind == "logs":
+                    for message in payload:
+                        self.log(f"[进程{worker_id}] {message}")
+                elif kind == "protocols":
+                    self.report_protocols(payload)
+                elif kind == "stats":
                     with self.lock:
-                        self.verified_count += 1
-                        progress = int(self.verified_count / self.total_count * 100)
-                        self.progress_signal.emit(progress)
-                        
-                except Exception as e:
-                    self.log_signal.emit(f"验证代理 {ip}:{port} 时出错: {str(e)}")
+                        self.deadline_killed += payload["deadline_killed"]
+                        self.traffic["sent"] += payload["sent"]
+                        self.traffic["received"] += payload["received"]
+                elif kind == "done":
+                    done.add(worker_id)
+            
+            if self.is_running:
+                # 所有进程都已退出时，还没被取走的块和未分发的代理都没有验证
+                unverified = sum(len(shard) for shard in shards.values()) + len(chunk or []) + sum(1 for _ in proxies)
+                if unverified:
+                    self.log(f"所有工作进程都已退出，{unverified} 个代理没有验证")
+        finally:
+            stop_event.set()
+            # 所有进程共用一个等待期限，停止时不会按进程数累加等待时间
+            join_deadline = stop_deadline or time.monotonic() + 1
+            for worker in workers:
+                worker.join(timeout=max(0, join_deadline - time.monotonic()))
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            
+            # 期限之后才交回的结果不再处理，记录丢弃的数量
+            discarded = 0
+            while True:
+                try:
+                    kind, _, payload = result_queue.get_nowait()
+                except Exception:
+                    # 队列已空，或被强制结束的进程只写入了一半数据
+                    break
+                if kind == "results":
+                    discarded += len(payload)
+            if discarded:
+                self.log(f"停止时有 {discarded} 个验证结果未能及时交回，已丢弃")
+    
+    def check_dead_workers(self, workers, done, unfinished):
+        """把意外退出的工作进程计为已结束，它取走但还没有结果的代理按无效报告"""
+        for index, worker in enumerate(workers):
+            worker_id = index + 1
+            if worker_id in done or worker.exitcode is None:
+                continue
+            done.add(worker_id)
+            lost = list(unfinished[worker_id].elements())
+            self.log(f"工作进程{worker_id}意外退出，退出码 {worker.exitcode}"
+                     + (f"，它正在验证的 {len(lost)} 个代理按无效处理" if lost else ""))
+            for ip, port in lost:
+                self.report_result(ip, port, False, 0.0)
+            unfinished[worker_id].clear()
+    
+    def run_coordinator(self):
+        """作为协调节点分发代理，工作节点验证后把结果汇报回来"""
+        self.coordinator = LeaseCoordinator(self.proxy_list)
+        # 工作节点汇报的结果会写入数据库，可从其他主机访问时必须用口令防止伪造汇报
+        if not self.worker_token and not is_loopback_host(self.coordinator_host):
+            self.log(f"协调节点监听 {self.coordinator_host} 可从其他主机访问，必须在\"验证设置\"中设置工作节点口令，验证未开始")
+            return
+        try:
+            server = ThreadingHTTPServer((self.coordinator_host, self.coordinator_port), CoordinatorHandler)
+        except OSError as e:
+            self.log(f"协调节点无法监听 {self.coordinator_host}:{self.coordinator_port}: {str(e)}")
+            return
+        server.daemon_threads = True
+        server.verifier = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        # 监听所有地址时，本地工作进程通过回环地址连接
+        local_host = "127.0.0.1" if self.coordinator_host in ("", "0.0.0.0") else self.coordinator_host
+        url = f"http://{local_host}:{self.coordinator_port}"
+        self.log(f"协调节点已启动: {self.coordinator_host}:{self.coordinator_port}，其他主机可运行 "
+                 f"python proxy_manager.py --worker http://本机地址:{self.coordinator_port} 加入验证")
+        
+        # 启动本地工作进程，打包后的程序直接以自身作为工作进程
+        command = [sys.executable] if getattr(sys, "frozen", False) else [sys.executable, os.path.abspath(__file__)]
+        command += ["--worker", url]
+        if self.worker_token:
+            command += ["--token", self.worker_token]
+        workers = [subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                   for _ in range(self.local_workers)]
+        if workers:
+            self.log(f"已启动 {len(workers)} 个本地工作进程")
+        
+        try:
+            while self.is_running and not self.coordinator.finished():
+                time.sleep(0.2)
+                for lease_id, worker, count in self.coordinator.expire():
+                    self.log(f"工作节点 {worker} 的租约 {lease_id} 超时，{count} 个代理重新分配")
+                self.flush_if_due()
+        finally:
+            self.coordinator.stop()
+            # 工作进程领取下一批时会得知已结束，等待片刻后强制结束
+            deadline = time.monotonic() + 2
+            for worker in workers:
+                try:
+                    worker.wait(max(0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+            server.shutdown()
+            server.server_close()
+    
+    def handle_lease(self, request):
+        """处理工作节点领取代理的请求"""
+        worker = str(request.get("worker", "?"))
+        lease = self.coordinator.lease(worker)
+        if lease is None:
+            return {"done": True}
+        lease_id, proxies = lease
+        if lease_id is None:
+            # 代理都已分配出去，等其他节点的租约完成或超时
+            return {"wait": 1}
+        return {"lease_id": lease_id, "proxies": proxies, "options": self.worker_options(1)}
+    
+    def handle_report(self, request):
+        """处理工作节点汇报的结果、日志和识别出的协议"""
+        worker = str(request.get("worker", "?"))
+        results = [tuple(result) for result in request.get("results", [])]
+        for result in self.coordinator.report(request.get("lease_id"), results, request.get("final", False)):
+            self.report_result(*result)
+        for message in request.get("logs", []):
+            self.log(f"[{worker}] {message}")
+        self.report_protocols([tuple(protocol) for protocol in request.get("protocols", [])])
+        stats = request.get("stats")
+        if stats:
+            with self.lock:
+                self.deadline_killed += stats["deadline_killed"]
+                self.traffic["sent"] += stats["sent"]
+                self.traffic["received"] += stats["received"]
+        return {"ok": True}
+    
+    def worker_options(self, processes):
+        """工作进程中验证器的参数，并发上限按进程数平均分配"""
+        return {
+            "max_workers": max(1, self.max_workers // processes),
+            "proxy_type": self.proxy_type,
+            "engine": "asyncio",
+            "timeout": self.timeout,
+            "quorum": self.quorum,
+            "prefilter": self.prefilter,
+            "tcp_limit": max(1, self.stage_limits["tcp"] // processes),
+            "handshake_limit": max(1, self.stage_limits["handshake"] // processes),
+            "detect_protocol": self.detect_protocol,
+            "stored_protocol": self.stored_protocol,
+            "connect_target": self.connect_target,
+            "deadline": self.deadline,
+            "adaptive_timeout": self.adaptive_timeout,
+            "timeout_factor": self.timeout_factor,
+            "timeout_floor": self.timeout_floor,
+            "adaptive_min_samples": self.adaptive_min_samples,
+            "batch_size": self.batch_size,
+            "batch_interval_ms": int(self.batch_interval * 1000),
+            "test_urls": self.test_urls,
+            "expect_token": self.expect_token,
+            "max_body_bytes": self.max_body_bytes,
+            "circuit_breaker": self.circuit_breaker,
+            "auto_concurrency": self.auto_concurrency,
+            "min_concurrency": self.min_concurrency
+        }
+    
+    async def verify_all_async(self):
+        semaphore = asyncio.Semaphore(self.max_workers)
+        self.stage_semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()}
+        
+        async def verify_one(ip, port, protocol):
+            try:
+                if self.prefilter:
+                    is_valid, response_time = await self.verify_staged_async(ip, port, protocol)
+                else:
+                    async with semaphore:
+                        if not self.is_running:
+                            return
+                        is_valid, response_time = await self.within_deadline_async(
+                            self.detect_and_verify_async(ip, port, protocol), self.deadline, ip, port)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 意外的异常按无效计入，否则这个代理永远不会完成，进度停在原处
+                self.log(f"验证代理 {ip}:{port} 时出错，按无效处理: {str(e)}")
+                is_valid, response_time = False, 0.0
+            if self.is_running:
+                self.report_result(ip, port, is_valid, response_time)
+        
+        # 按需创建任务，同时存在的任务不超过 window 个，不会一次为所有代理创建任务
+        pending = set()
+        try:
+            async for proxy in self.iter_proxies_async():
+                if not self.is_running:
+                    break
+                while len(pending) >= self.current_window(self.window):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    self.collect_task_errors(done)
+                    self.tune_concurrency()
+                pending.add(asyncio.ensure_future(verify_one(proxy[0], proxy[1], self.proxy_protocol(proxy))))
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                self.collect_task_errors(done)
+        finally:
+            # 被停止时取消还没完成的任务
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+    
+    def collect_task_errors(self, tasks):
+        """取出已完成任务中的异常并记录，避免异常被静默丢弃"""
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                self.log(f"验证代理时出错: {str(task.exception())}")
+    
+    async def detect_and_verify_async(self, ip, port, protocol):
+        if self.detect_protocol:
+            protocol = await self.detect_and_report_async(ip, port, protocol)
+            if protocol is None:
+                return False, 0.0
+        return await self.verify_proxy_async(ip, port, protocol)
+    
+    async def within_deadline_async(self, coro, budget, ip, port):
+        """在剩余时间预算内完成验证，超时则终止并计数"""
+        try:
+            if budget <= 0:
+                coro.close()
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(coro, budget)
+        except asyncio.TimeoutError:
+            self.count_deadline_killed(ip, port)
+            return False, 0.0
+    
+    def count_deadline_killed(self, ip, port):
+        with self.lock:
+            self.deadline_killed += 1
+        self.log(f"代理 {ip}:{port} 超过 {self.deadline} 秒时间预算，已终止验证")
+    
+    def proxy_protocol(self, proxy):
+        """代理使用的协议，自动识别时以列表中记录的类型作为首先尝试的协议，
+        stored_protocol 时直接使用记录的类型"""
+        if (self.detect_protocol or self.stored_protocol) and len(proxy) > 2 and proxy[2] in PROXY_PROTOCOLS:
+            return proxy[2]
+        return self.proxy_type
+    
+    async def verify_staged_async(self, ip, port, protocol):
+        """分阶段验证，只有通过TCP连接和代理握手的代理才进行HTTP内容检查，握手后的连接留给HTTP检查继续使用"""
+        # 第一阶段: 非阻塞TCP连接
+        async with self.stage_semaphores["tcp"]:
+            if not self.is_running:
+                return False, 0.0
+            # 时间预算从发起连接开始计算，不包括排队等待各阶段名额的时间
+            started = time.monotonic()
+            limit = min(self.current_timeout(), self.deadline)
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), limit)
+            except Exception as e:
+                self.count_stage("tcp", False)
+                self.record_outcomes({ip: self.classify_error(e)})
+                if isinstance(e, asyncio.TimeoutError) and limit >= self.deadline:
+                    self.count_deadline_killed(ip, port)
+                return False, 0.0
+            self.count_stage("tcp", True)
+            # 先拿到握手名额再释放连接名额，连接不会在阶段之间堆积；等待时被取消同样会释放连接名额
+            try:
+                await self.stage_semaphores["handshake"].acquire()
+            except BaseException:
+                writer.close()
+                raise
         
-        self.finished_signal.emit()
+        # 第二阶段: 代理协议握手
+        connection = None
+        try:
+            remaining = self.deadline - (time.monotonic() - started)
+            limit = remaining if self.detect_protocol else min(self.current_timeout(), remaining)
+            try:
+                protocol, connection = await asyncio.wait_for(
+                    self.handshake_stage_async(ip, port, protocol, reader, writer), limit)
+            except Exception as e:
+                protocol = None
+                if isinstance(e, asyncio.TimeoutError) and limit >= remaining:
+                    self.count_deadline_killed(ip, port)
+        finally:
+            self.stage_semaphores["handshake"].release()
+            if connection is None:
+                writer.close()
+        self.count_stage("handshake", protocol is not None)
+        if protocol is None:
+            return False, 0.0
+        
+        # 第三阶段: 通过代理访问测试网站
+        spent = time.monotonic() - started
+        try:
+            async with self.stage_semaphores["http"]:
+                if not self.is_running:
+                    return False, 0.0
+                is_valid, response_time = await self.within_deadline_async(
+                    self.verify_proxy_async(ip, port, protocol, connection), self.deadline - spent, ip, port)
+        finally:
+            # 连接没有用上（停止、超时或目标已停用）时在这里关闭
+            if connection is not None:
+                connection[1].close()
+        self.count_stage("http", is_valid)
+        return is_valid, response_time
+    
+    async def handshake_stage_async(self, ip, port, protocol, reader, writer):
+        """完成握手阶段，返回 (协议, 可继续使用的连接)，握手失败时协议为 None
+        
+        可继续使用的连接为 (reader, writer, url): url 为 None 表示 SOCKS5 已完成问候、可以连接任意测试网站，
+        否则是已连通到该测试网站的 SOCKS4 隧道。HTTP 代理的 CONNECT 探测之后连接已成为隧道，不能再发普通请求。
+        """
+        if self.detect_protocol:
+            # 自动识别时，协议指纹探测就是握手阶段，复用已建立的连接做第一次探测
+            handoff = []
+            protocol = await self.detect_and_report_async(ip, port, protocol, (reader, writer), handoff)
+            return protocol, (handoff[0] if handoff else None)
+        
+        url = self.probe_targets()[0]
+        if not await self.handshake_async(reader, writer, protocol, url):
+            return None, None
+        if protocol == "socks5":
+            return protocol, (reader, writer, None)
+        if protocol in ("socks4", "socks4a"):
+            return protocol, (reader, writer, url)
+        return protocol, None
+    
+    async def handshake_async(self, reader, writer, protocol, url):
+        """发送代理协议的首个握手报文，对方按协议正确应答时返回 True"""
+        if protocol == "socks5":
+            # SOCKS5 问候: 版本5，1种认证方式，无需认证
+            writer.write(b"\x05\x01\x00")
+            await writer.drain()
+            return await reader.readexactly(2) == b"\x05\x00"
+        
+        parts = urlsplit(url)
+        host = parts.hostname
+        if protocol in ("socks4", "socks4a"):
+            # SOCKS4 没有单独的问候报文，直接请求连接测试网站，连通的隧道留给HTTP检查使用
+            try:
+                await self.socks4_connect(reader, writer, host, parts.port or 80, protocol == "socks4a")
+                return True
+            except ConnectionError:
+                return False
+        
+        # HTTP 代理: 发送 CONNECT，只要对方按 HTTP 协议应答就说明代理服务存活
+        writer.write(f"CONNECT {self.connect_target} HTTP/1.1\r\nHost: {self.connect_target}\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        status_line = await reader.readline()
+        return status_line.startswith(b"HTTP/")
+    
+    async def detect_and_report_async(self, ip, port, hint, connection=None, handoff=None):
+        """识别代理协议，与记录的类型不同时随结果批量发出 protocol_signal，无法识别时返回 None"""
+        protocol = await self.detect_protocol_async(ip, port, hint, connection, handoff)
+        if protocol is None:
+            self.log(f"代理 {ip}:{port} 无法识别协议")
+        elif protocol != hint:
+            self.log(f"代理 {ip}:{port} 识别为 {protocol}（原记录为 {hint}）")
+            self.report_protocols([(ip, port, protocol)])
+        return protocol
+    
+    async def detect_protocol_async(self, ip, port, hint, connection=None, handoff=None):
+        """依次发送各协议的探测报文，返回识别出的协议
+        
+        先试 HTTP，SOCKS 服务收到 "CONNECT" 会因版本号不符立即断开；记录的类型总是最先尝试。
+        传入 handoff 列表时，识别为 SOCKS5 的连接已完成问候，不关闭而是以 (reader, writer, None) 放入列表。
+        """
+        families = ["http", "socks5", "socks4"]
+        hint_family = "socks4" if hint in ("socks4", "socks4a") else ("http" if hint == "https" else hint)
+        if hint_family in families:
+            families.remove(hint_family)
+            families.insert(0, hint_family)
+        
+        for family in families:
+            if not self.is_running:
+                return None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(asyncio.open_connection(ip, port), self.current_timeout())
+                reader, writer = connection
+                try:
+                    protocol = await asyncio.wait_for(self.fingerprint_async(reader, writer, family), self.current_timeout())
+                except BaseException:
+                    writer.close()
+                    raise
+                if protocol == "socks5" and handoff is not None:
+                    handoff.append((reader, writer, None))
+                else:
+                    writer.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                protocol = None
+            connection = None
+            if protocol:
+                return protocol
+        return None
+    
+    async def fingerprint_async(self, reader, writer, family):
+        """用一个连接探测代理是否属于 family 协议族，返回具体协议或 None
+        
+        每个探测报文末尾都带 "\\r\\n\\r\\n"，使其他协议的服务端也能立即应答或断开，而不是等到超时。
+        """
+        if family == "http":
+            # 能建立到 TLS 网站的隧道才识别为 https
+            writer.write(f"CONNECT {self.connect_target} HTTP/1.1\r\nHost: {self.connect_target}\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            fields = (await reader.readline()).split()
+            if len(fields) < 2 or not fields[0].startswith(b"HTTP/"):
+                return None
+            return "https" if fields[1] == b"200" else "http"
+        
+        if family == "socks5":
+            # 问候报文补齐到8字节，SOCKS4 服务端读满请求头后会因版本号不符断开
+            writer.write(b"\x05\x01\x00\r\n\r\n\x00")
+            await writer.drain()
+            reply = await reader.readexactly(2)
+            return "socks5" if reply == b"\x05\x00" else None
+        
+        # SOCKS4a 请求: 目标地址 0.0.0.1 表示由代理解析后面附带的域名
+        host_bytes = urlsplit(self.test_urls[0]).hostname.encode("idna")
+        writer.write(b"\x04\x01\x00\x50\x00\x00\x00\x01\x00" + host_bytes + b"\x00\r\n\r\n")
+        await writer.drain()
+        reply = await reader.readexactly(8)
+        if reply[0] != 0 or not 0x5A <= reply[1] <= 0x5D:
+            return None
+        # 能用域名连接说明支持 4a 扩展，否则按普通 SOCKS4 处理
+        return "socks4a" if reply[1] == 0x5A else "socks4"
+    
+    def count_stage(self, stage, passed):
+        self.stage_stats[stage]["pass" if passed else "fail"] += 1
+    
+    def log_stage_stats(self):
+        names = {"tcp": "TCP连接", "handshake": "代理握手", "http": "HTTP检查"}
+        parts = []
+        for stage, counts in self.stage_stats.items():
+            parts.append(f"{names[stage]}(并发{self.stage_limits[stage]}) 通过 {counts['pass']} / 失败 {counts['fail']}")
+        self.log("分阶段验证统计: " + "，".join(parts))
+    
+    def cache_fingerprint(self):
+        """缓存中区分验证设置的指纹: 协议（自动识别为 "auto"，按记录的协议验证为 "stored"）、测试网站和校验内容"""
+        protocol = "auto" if self.detect_protocol else "stored" if self.stored_protocol else self.proxy_type
+        return protocol, tuple(self.test_urls), self.expect_token
+    
+    def skip_cached(self, proxies):
+        """跳过缓存中结果仍新鲜的代理"""
+        for proxy in proxies:
+            if not self.report_if_cached(proxy):
+                yield proxy
+    
+    def report_if_cached(self, proxy):
+        """缓存中的结果仍新鲜时直接报告并返回 True"""
+        if self.cache is None:
+            return False
+        cached = self.cache.lookup(self.cache_fingerprint(), proxy[0], proxy[1], self.cache_good_ttl, self.cache_dead_ttl)
+        if cached is None:
+            return False
+        is_valid, response_time = cached
+        with self.lock:
+            self.cache_hits["good" if is_valid else "dead"] += 1
+        self.report_result(proxy[0], proxy[1], is_valid, response_time, cached=True)
+        return True
     
-    def verify_proxy(self, ip, port):
+    async def iter_proxies_async(self):
+        """逐个取出待验证的代理，来自流水线时轮询等待新代理，不阻塞事件循环"""
+        if self.pipeline is None:
+            for proxy in self.proxy_list:
+                yield proxy
+            return
+        while self.is_running:
+            try:
+                proxy = self.pipeline.get_nowait()
+            except Empty:
+                await asyncio.sleep(0.05)
+                continue
+            if proxy is None:
+                return
+            if self.cache_good_ttl > 0 or self.cache_dead_ttl > 0:
+                if self.report_if_cached(proxy):
+                    continue
+            yield proxy
+    
+    def report_result(self, ip, port, is_valid, response_time, cached=False):
+        """发送单个代理的验证结果并更新进度，cached 表示结果来自缓存"""
+        # 确保response_time是有效的浮点数
+        if response_time is None:
+            response_time = 0.0
+        
+        if self.batch_results:
+            with self.lock:
+                (self.pending_cached if cached else self.pending_results).append((ip, port, is_valid, response_time))
+        else:
+            self.update_signal.emit(ip, port, is_valid, response_time)
+        
+        # 更新进度，百分比变化时才发送
+        with self.lock:
+            self.verified_count += 1
+            progress = int(self.verified_count / self.total_count * 100) if self.total_count else -1
+        if progress != self.last_progress and progress >= 0:
+            self.last_progress = progress
+            self.progress_signal.emit(progress)
+        
+        if (len(self.pending_results) >= self.batch_size or len(self.pending_logs) >= self.batch_size
+                or len(self.pending_cached) >= self.batch_size):
+            self.flush()
+    
+    def verify_proxy(self, ip, port, protocol=None):
+        protocol = protocol or self.proxy_type
         try:
             start_time = time.time()
-            
-            # 设置超时时间
-            socket.setdefaulttimeout(5)
+            # 不修改全局的 socket 默认超时，每次读写按剩余时间预算单独设置
+            deadline_at = time.monotonic() + self.deadline
             
             # 使用requests的代理功能
+            proxy_url = self.proxy_url(protocol, ip, port)
             proxies = {
-                'http': f'{self.proxy_type}://{ip}:{port}',
-                'https': f'{self.proxy_type}://{ip}:{port}'
+                'http': proxy_url,
+                'https': proxy_url
             }
             
             # 测试连接多个网站，确保代理真正可用
-            test_urls = [
-                "http://www.baidu.com",
-                "http://www.qq.com",
-                "http://www.163.com",
-                "http://www.sohu.com",
-                "http://www.sina.com.cn"
-            ]
+            session = self.get_worker_session()
+            targets = self.probe_targets()
+            outcomes = {}
+            kinds = {}
+            # 登记这个代理用到的套接字，超过时间预算时由看门狗关闭
+            probe_sockets.sockets = []
+            watch_id = self.watchdog.watch(deadline_at, probe_sockets.sockets) if self.watchdog is not None else None
+            try:
+                for url in targets:
+                    if not self.is_running:
+                        return False, 0.0
+                    try:
+                        outcomes[url] = self.probe_succeeded(*self.fetch_with_deadline(session, url, proxies, deadline_at))
+                        kinds[url] = "ok" if outcomes[url] else "fail"
+                    except TimeoutError:
+                        kinds[url] = "timeout"
+                        if time.monotonic() >= deadline_at:
+                            self.record_outcomes(kinds)
+                            self.count_deadline_killed(ip, port)
+                            return False, 0.0
+                        outcomes[url] = False
+                    except Exception as e:
+                        kinds[url] = self.classify_error(e)
+                        outcomes[url] = False
+                    
+                    # 线程引擎无法中断进行中的请求，快速判定时只跳过剩余网站
+                    if self.quorum and self.verdict_settled(sum(outcomes.values()), len(outcomes), targets):
+                        break
+            finally:
+                probe_sockets.sockets = None
+                if watch_id is not None:
+                    self.watchdog.cancel(watch_id)
+                self.release_proxy_pools(session)
+            
+            end_time = time.time()
+            response_time = end_time - start_time
+            
+            self.record_target_health(outcomes)
+            self.record_outcomes(kinds)
+            return self.judge_result(ip, port, protocol, sum(outcomes.values()), response_time, targets)
+        except Exception as e:
+            self.log(f"代理 {ip}:{port} ({protocol}) 验证失败: {str(e)}")
+            return False, 0.0
+    
+    def fetch_with_deadline(self, session, url, proxies, deadline_at):
+        """请求测试网站并读取至多 max_body_bytes 字节的响应体，返回 (状态码, 响应体)。
+        每次读写的超时不超过剩余预算，整体超过 deadline_at 时由看门狗关闭套接字"""
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("超过时间预算")
+        timeout = min(self.current_timeout(), remaining)
+        response = None
+        body = b""
+        try:
+            started = time.monotonic()
+            # 不跟随重定向，重定向本身已说明代理转发了请求
+            response = session.get(url, proxies=proxies, timeout=(timeout, timeout), stream=True,
+                                   allow_redirects=False)
+            with self.lock:
+                self.active_responses.add(response)
+            elapsed = time.monotonic() - started
+            # 逐块读取响应体，每次读取前检查预算并把套接字超时缩短到剩余预算
+            while self.is_running and len(body) < self.max_body_bytes:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("超过时间预算")
+                connection = response.raw.connection
+                if connection is not None and connection.sock is not None:
+                    connection.sock.settimeout(min(self.current_timeout(), remaining))
+                chunk = response.raw.read(min(8192, self.max_body_bytes - len(body)))
+                if not chunk:
+                    break
+                body += chunk
+            if self.probe_succeeded(response.status_code, body):
+                self.latency.add(elapsed)
+        except Exception:
+            # 连接、读取超时由 requests/urllib3 包装后抛出，预算已耗尽时统一按超时处理
+            if time.monotonic() >= deadline_at:
+                raise TimeoutError("超过时间预算") from None
+            raise
+        finally:
+            if response is not None:
+                with self.lock:
+                    self.active_responses.discard(response)
+                response.close()
+                self.count_traffic(self.request_size(response.request), self.response_head_size(response) + len(body))
+        if not self.is_running:
+            raise RuntimeError("验证已停止")
+        return response.status_code, body
+    
+    @staticmethod
+    def request_size(request):
+        """估算 requests 发出的请求字节数"""
+        size = len(request.method) + len(request.url) + len(" HTTP/1.1\r\n") + 2
+        return size + sum(len(key) + len(value) + 4 for key, value in request.headers.items())
+    
+    @staticmethod
+    def response_head_size(response):
+        """估算响应的状态行和响应头字节数"""
+        size = len("HTTP/1.1 000 ") + len(response.reason or "") + 4
+        return size + sum(len(key) + len(value) + 4 for key, value in response.headers.items())
+    
+    def probe_succeeded(self, status, body):
+        """判断一次探测是否成功: 设置了标记时要求 2xx 且响应体包含标记，否则 2xx 和 3xx 均可"""
+        if self.expect_token:
+            return 200 <= status < 300 and self.expect_token.encode() in body
+        return 200 <= status < 400
+    
+    def probe_targets(self):
+        """本次验证要访问的测试网站，开启熔断时跳过停用中的网站，全部停用时仍使用所有网站"""
+        if self.circuit_breaker:
+            return self.target_health.active_targets() or self.test_urls
+        return self.test_urls
+    
+    def record_target_health(self, outcomes):
+        if self.circuit_breaker:
+            for event in self.target_health.record(outcomes):
+                self.log(event)
+    
+    def required_successes(self, targets):
+        """代理有效所需的成功次数，按可用网站占全部网站的比例缩减，至少为1。
+        没有可用网站时同样至少需要1次成功，代理只能判为无效"""
+        required = math.ceil(MIN_SUCCESS_COUNT * len(targets) / len(self.test_urls))
+        return max(1, min(len(targets), required))
+    
+    def get_worker_session(self):
+        """获取当前工作线程的 Session，连接池和适配器只在线程第一次验证时创建"""
+        session = getattr(self.thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            # 确保不使用系统代理设置
+            session.trust_env = False
+            adapter = HTTPAdapter(pool_connections=len(self.test_urls), pool_maxsize=1, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.thread_local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+    
+    def release_proxy_pools(self, session):
+        """统计并关闭当前代理的连接池
+        
+        HTTPAdapter 为每个代理地址缓存一个连接池管理器，验证完一个代理后不再使用，
+        不清理的话大批量验证时会一直累积。
+        """
+        connections = 0
+        requests_count = 0
+        for adapter in set(session.adapters.values()):
+            for manager in adapter.proxy_manager.values():
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        requests_count += pool.num_requests
+                manager.clear()
+            adapter.proxy_manager.clear()
+        with self.lock:
+            self.pool_stats["connections"] += connections
+            self.pool_stats["requests"] += requests_count
+    
+    @staticmethod
+    def proxy_url(protocol, ip, port):
+        """生成 requests 使用的代理地址，https 类型的代理同样以 http:// 方式使用 CONNECT"""
+        scheme = "http" if protocol == "https" else protocol
+        return f"{scheme}://{ip}:{port}"
+    
+    async def verify_proxy_async(self, ip, port, protocol, connection=None):
+        """verify_proxy 的异步版本，直接在套接字上完成代理握手和 HTTP 请求
+        
+        connection 是握手阶段留下的连接 (reader, writer, url)，用于访问第一个测试网站，
+        SOCKS4 隧道只能用于握手时连接的网站，该网站已停用时关闭。
+        """
+        try:
+            start_time = time.time()
             
-            success_count = 0
-            for url in test_urls:
-                try:
-                    response = requests.get(url, proxies=proxies, timeout=5)
-                    if response.status_code == 200:
-                        success_count += 1
-                except Exception:
-                    pass
+            targets = self.probe_targets()
+            connections = {}
+            if connection is not None:
+                if (connection[2] or targets[0]) in targets:
+                    connections[connection[2] or targets[0]] = connection
+                else:
+                    connection[1].close()
+            kinds = {}
+            # 依次访问时，上一个网站完整读完响应的连接留给下一个网站复用；快速判定并行访问，各网站各用一个连接
+            pool = {}
+            try:
+                if self.quorum:
+                    outcomes = await self.probe_quorum_async(ip, port, protocol, targets, kinds, connections)
+                else:
+                    outcomes = {}
+                    for url in targets:
+                        outcomes[url] = await self.probe_target_async(ip, port, protocol, url, kinds,
+                                                                      connections.get(url), pool)
+            finally:
+                # 超出时间预算被取消时，已完成的探测同样计入
+                self.record_outcomes(kinds)
+                for idle in pool.values():
+                    for _, writer in idle:
+                        writer.close()
             
             end_time = time.time()
             response_time = end_time - start_time
             
-            # 只有当至少有2个网站能成功访问时，才认为代理有效
-            if success_count >= 2:
-                self.log_signal.emit(f"代理 {ip}:{port} ({self.proxy_type}) 验证有效，响应时间: {response_time:.2f}秒，成功率: {success_count}/{len(test_urls)}")
-                return True, response_time
-            
-            self.log_signal.emit(f"代理 {ip}:{port} ({self.proxy_type}) 验证无效，成功率: {success_count}/{len(test_urls)}")
-            return False, 0.0
+            self.record_target_health(outcomes)
+            return self.judge_result(ip, port, protocol, sum(outcomes.values()), response_time, targets)
         except Exception as e:
-            self.log_signal.emit(f"代理 {ip}:{port} ({self.proxy_type}) 验证失败: {str(e)}")
+            self.log(f"代理 {ip}:{port} ({protocol}) 验证失败: {str(e)}")
             return False, 0.0
     
+    async def probe_quorum_async(self, ip, port, protocol, targets, kinds, connections):
+        """同时访问所有测试网站，结论确定后取消其余请求，返回已完成网站的结果 {url: 是否成功}"""
+        task_to_url = {asyncio.ensure_future(
+            self.probe_target_async(ip, port, protocol, url, kinds, connections.get(url))): url for url in targets}
+        pending = set(task_to_url)
+        outcomes = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcomes[task_to_url[task]] = task.result()
+                if self.verdict_settled(sum(outcomes.values()), len(outcomes), targets):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        return outcomes
+    
+    async def probe_target_async(self, ip, port, protocol, url, kinds, connection=None, pool=None):
+        """通过代理访问单个测试网站，成功返回 True，结果类型记入 kinds[url]"""
+        try:
+            started = time.monotonic()
+            status, body = await asyncio.wait_for(
+                self.fetch_via_proxy(ip, port, protocol, url, connection=connection, pool=pool), self.current_timeout())
+            # 重定向同样说明代理已正确转发请求
+            if self.probe_succeeded(status, body):
+                self.latency.add(time.monotonic() - started)
+                kinds[url] = "ok"
+                return True
+            kinds[url] = "fail"
+            return False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            kinds[url] = self.classify_error(e)
+            return False
+    
+    def verdict_settled(self, success_count, done_count, targets):
+        """已完成 done_count 个网站时，是否已能确定代理有效或无效"""
+        required = self.required_successes(targets)
+        if success_count >= required:
+            return True
+        return done_count - success_count > len(targets) - required
+    
+    def judge_result(self, ip, port, protocol, success_count, response_time, targets):
+        # 只有当至少有2个网站能成功访问时，才认为代理有效，部分网站停用时按比例减少
+        if success_count >= self.required_successes(targets):
+            self.log(f"代理 {ip}:{port} ({protocol}) 验证有效，响应时间: {response_time:.2f}秒，成功率: {success_count}/{len(targets)}")
+            return True, response_time
+        
+        self.log(f"代理 {ip}:{port} ({protocol}) 验证无效，成功率: {success_count}/{len(targets)}")
+        return False, 0.0
+    
+    async def fetch_via_proxy(self, ip, port, protocol, url, body_limit=None, connection=None, pool=None):
+        """通过代理发送一个 GET 请求，返回 (状态码, 响应体)。
+        只有设置了 expect_token 或 body_limit 时才返回响应体，且至多读取 body_limit 或 max_body_bytes 字节。
+        connection 为握手阶段留下的连接 (reader, writer, url)，传入时跳过已完成的握手步骤。
+        pool 为同一代理的空闲连接 {键: [(reader, writer), ...]}，传入时优先复用其中的连接，
+        响应完整读完的连接放回 pool 留给下一个测试网站"""
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"只支持 http:// 测试地址: {url}")
+        host = parts.hostname
+        target_port = parts.port or 80
+        # HTTP 代理的连接可以继续访问任意网站，SOCKS 隧道只能继续访问同一主机和端口
+        key = "http" if protocol in ("http", "https") else (host, target_port)
+        if connection is None and pool and pool.get(key):
+            reader, writer = pool[key].pop()
+            result = await self.send_request_async(reader, writer, protocol, url, body_limit, pool, key, reused=True)
+            if result is not None:
+                return result
+            # 空闲连接已被对方关闭，改用新连接
+        
+        if connection is None:
+            reader, writer = await asyncio.open_connection(ip, port)
+        else:
+            reader, writer, _ = connection
+        try:
+            if protocol == "socks5":
+                await self.socks5_connect(reader, writer, host, target_port, greeted=connection is not None)
+            elif protocol in ("socks4", "socks4a") and connection is None:
+                # 握手阶段留下的 SOCKS4 连接已经连通到该网站
+                await self.socks4_connect(reader, writer, host, target_port, protocol == "socks4a")
+        except BaseException:
+            writer.close()
+            raise
+        return await self.send_request_async(reader, writer, protocol, url, body_limit, pool, key)
+    
+    async def send_request_async(self, reader, writer, protocol, url, body_limit, pool, key, reused=False):
+        """在已连通的连接上发送 GET 请求并读取响应，返回 (状态码, 响应体)；复用的空闲连接已被对方关闭时返回 None
+        
+        传入 pool 时请求保持连接，长度已知且不超过 max_body_bytes 的响应会完整读完，连接放回 pool[key]；
+        更长或长度未知的响应只读取需要的部分，随后关闭连接。
+        """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        # HTTP 代理使用绝对地址形式的请求行
+        request_target = url if protocol in ("http", "https") else path
+        request = (f"GET {request_target} HTTP/1.1\r\n"
+                   f"Host: {parts.hostname}\r\n"
+                   f"User-Agent: Mozilla/5.0\r\n"
+                   f"Accept: */*\r\n"
+                   f"Connection: {'keep-alive' if pool is not None else 'close'}\r\n\r\n")
+        sent = received = 0
+        reusable = False
+        if not reused:
+            self.pool_stats["connections"] += 1
+        self.pool_stats["requests"] += 1
+        try:
+            try:
+                writer.write(request.encode("ascii"))
+                await writer.drain()
+                status_line = await reader.readline()
+            except ConnectionError:
+                if not reused:
+                    raise
+                status_line = b""
+            if reused and not status_line:
+                self.pool_stats["requests"] -= 1
+                return None
+            sent = len(request)
+            received += len(status_line)
+            fields = status_line.split()
+            if len(fields) < 2 or not fields[0].startswith(b"HTTP/"):
+                raise ConnectionError(f"无效的响应: {status_line[:50]!r}")
+            status = int(fields[1])
+            wanted = self.expect_token or body_limit
+            if pool is None and not wanted:
+                return status, b""
+            
+            # 读取响应头，取得 Content-Length 后读取有限长度的响应体
+            content_length = 0 if status in (204, 304) else None
+            keep_alive = fields[0] == b"HTTP/1.1"
+            while True:
+                line = await reader.readline()
+                received += len(line)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length" and value.strip().isdigit():
+                    content_length = int(value.strip())
+                elif name in (b"connection", b"proxy-connection") and value.strip().lower() == b"close":
+                    keep_alive = False
+            limit = body_limit or self.max_body_bytes
+            drain = (pool is not None and keep_alive and content_length is not None
+                     and content_length <= max(limit, self.max_body_bytes))
+            if drain:
+                limit = content_length
+            elif not wanted:
+                return status, b""
+            elif content_length is not None:
+                limit = min(content_length, limit)
+            body = b""
+            while len(body) < limit:
+                chunk = await reader.read(limit - len(body))
+                if not chunk:
+                    break
+                body += chunk
+            received += len(body)
+            reusable = drain and len(body) == content_length
+            return status, (body[:body_limit or self.max_body_bytes] if wanted else b"")
+        finally:
+            if reusable:
+                pool.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+            self.count_traffic(sent, received)
+    
+    async def socks5_connect(self, reader, writer, host, port, greeted=False):
+        """完成 SOCKS5 无认证握手，并请求连接到目标主机，greeted 为 True 时问候已在握手阶段完成"""
+        if not greeted:
+            writer.write(b"\x05\x01\x00")
+            await writer.drain()
+            reply = await reader.readexactly(2)
+            if reply != b"\x05\x00":
+                raise ConnectionError(f"SOCKS5 握手失败: {reply!r}")
+        
+        host_bytes = host.encode("idna")
+        writer.write(b"\x05\x01\x00\x03" + bytes([len(host_bytes)]) + host_bytes + port.to_bytes(2, "big"))
+        await writer.drain()
+        reply = await reader.readexactly(4)
+        if reply[0] != 5 or reply[1] != 0:
+            raise ConnectionError(f"SOCKS5 连接目标失败，错误码: {reply[1]}")
+        
+        # 跳过代理返回的绑定地址
+        if reply[3] == 1:
+            await reader.readexactly(4 + 2)
+        elif reply[3] == 4:
+            await reader.readexactly(16 + 2)
+        else:
+            length = (await reader.readexactly(1))[0]
+            await reader.readexactly(length + 2)
+    
+    async def socks4_connect(self, reader, writer, host, port, remote_dns):
+        """发送 SOCKS4/4a 连接请求，remote_dns 为 True 时由代理解析域名"""
+        if remote_dns:
+            request = b"\x04\x01" + port.to_bytes(2, "big") + b"\x00\x00\x00\x01\x00" + host.encode("idna") + b"\x00"
+        else:
+            # SOCKS4 只接受 IPv4 地址，需要在本地解析域名
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_STREAM)
+            request = b"\x04\x01" + port.to_bytes(2, "big") + socket.inet_aton(infos[0][4][0]) + b"\x00"
+        writer.write(request)
+        await writer.drain()
+        reply = await reader.readexactly(8)
+        if reply[0] != 0 or reply[1] != 0x5A:
+            raise ConnectionError(f"SOCKS4 连接目标失败，错误码: {reply[1]}")
+    
     def stop(self):
+        """停止验证: 不再开始新的探测，并尽快中断进行中的探测"""
+        if not self.is_running:
+            return
         self.is_running = False
+        self.cancelled = True
+        if self.coordinator is not None:
+            self.coordinator.stop()
+        if self.pipeline is not None:
+            self.pipeline.close()
+        
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.main_task.cancel)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
+        
+        # threads 引擎: 关闭正在读取响应的套接字，阻塞中的读取会立即返回
+        with self.lock:
+            responses = list(self.active_responses)
+        for response in responses:
+            try:
+                connection = response.raw.connection
+                if connection is not None and connection.sock is not None:
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+
+def iter_shard_queue(task_queue, stop_event, taken=None):
+    """从任务队列中逐块取出代理，收到 None 或停止信号时结束，每取出一块用块编号调用 taken"""
+    while not stop_event.is_set():
+        try:
+            chunk = task_queue.get(timeout=0.2)
+        except Empty:
+            continue
+        if chunk is None:
+            return
+        chunk_id, proxies = chunk
+        if taken is not None:
+            taken(chunk_id)
+        yield from proxies
+
+def verify_shard_worker(worker_id, task_queue, result_queue, stop_event, options):
+    """processes 引擎的工作进程: 在本进程内直接运行一个验证器，结果和日志通过队列发回主进程"""
+    # 告知主进程取走了哪一块，本进程意外退出时主进程据此找出没有结果的代理
+    taken = lambda chunk_id: result_queue.put(("taken", worker_id, chunk_id))
+    verifier = ProxyVerifier(iter_shard_queue(task_queue, stop_event, taken), **options)
+    verifier.batch_signal.connect(lambda results: result_queue.put(("results", worker_id, results)))
+    verifier.log_batch_signal.connect(lambda messages: result_queue.put(("logs", worker_id, messages)))
+    verifier.protocol_signal.connect(lambda protocols: result_queue.put(("protocols", worker_id, protocols)))
+    verifier.concurrency_signal.connect(lambda limit: None)
+    
+    # 主进程要求停止时，中断本进程的验证。
+    # 这里轮询而不是 stop_event.wait()，进程退出时若仍在等待，主进程 set() 会一直等待它被唤醒
+    def watch_stop():
+        while not stop_event.is_set():
+            time.sleep(0.2)
+        verifier.stop()
+    threading.Thread(target=watch_stop, daemon=True).start()
+    
+    try:
+        verifier.run()
+    finally:
+        result_queue.put(("stats", worker_id, {"deadline_killed": verifier.deadline_killed,
+                                               "sent": verifier.traffic["sent"],
+                                               "received": verifier.traffic["received"]}))
+        result_queue.put(("done", worker_id, None))
+
+def run_worker(coordinator_url, token=""):
+    """distributed 引擎的工作节点，不需要界面: 反复领取一批代理，验证后把结果汇报给协调节点"""
+    session = requests.Session()
+    session.trust_env = False
+    headers = {"X-Worker-Token": token} if token else {}
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    
+    # 汇报放在单独的线程中发送，不阻塞验证的事件循环
+    reports = Queue()
+    def send_reports():
+        while True:
+            report = reports.get()
+            if report is None:
+                return
+            for _ in range(3):
+                try:
+                    session.post(f"{coordinator_url}/report", json=report, headers=headers, timeout=10)
+                    break
+                except requests.RequestException:
+                    time.sleep(1)
+    sender = threading.Thread(target=send_reports, daemon=True)
+    sender.start()
+    
+    failures = 0
+    while True:
+        try:
+            reply = session.post(f"{coordinator_url}/lease", json={"worker": worker}, headers=headers, timeout=10).json()
+            failures = 0
+        except (requests.RequestException, ValueError):
+            # 协调节点连续30秒无法访问时退出
+            failures += 1
+            if failures > 30:
+                break
+            time.sleep(1)
+            continue
+        if reply.get("done"):
+            break
+        if "lease_id" not in reply:
+            time.sleep(reply.get("wait", 1))
+            continue
+        
+        lease_id = reply["lease_id"]
+        def report(**fields):
+            reports.put(dict(fields, worker=worker, lease_id=lease_id))
+        verifier = ProxyVerifier([tuple(proxy) for proxy in reply["proxies"]], **reply["options"])
+        verifier.batch_signal.connect(lambda results: report(results=results))
+        verifier.log_batch_signal.connect(lambda messages: report(logs=messages))
+        verifier.protocol_signal.connect(lambda protocols: report(protocols=protocols))
+        verifier.run()
+        report(final=True, stats={"deadline_killed": verifier.deadline_killed,
+                                  "sent": verifier.traffic["sent"], "received": verifier.traffic["received"]})
+    
+    reports.put(None)
+    sender.join()
+
+def header_addresses(value):
+    """取出请求头中的各个地址: X-Forwarded-For 等用逗号分隔，Forwarded 形如 for="[2001:db8::1]:4711";proto=http"""
+    addresses = set()
+    for token in re.split(r"[,;\s]+", value):
+        token = token.partition("=")[2] if "=" in token else token
+        token = token.strip('"')
+        if token.startswith("["):
+            token = token[1:].partition("]")[0]
+        elif token.count(":") == 1:
+            # 去掉 IPv4 地址后面的端口
+            token = token.partition(":")[0]
+        if token:
+            addresses.add(token)
+    return addresses
+
+def classify_anonymity(headers, remote_addr, local_ip):
+    """根据回显的请求头和来源地址判断匿名级别，本机IP必须与某个完整地址相同，不按子串匹配"""
+    headers = {str(name).lower(): str(value) for name, value in headers.items()}
+    if local_ip and (remote_addr == local_ip or any(local_ip in header_addresses(value) for value in headers.values())):
+        return "transparent"
+    if any(name in headers for name in PROXY_HEADERS):
+        return "anonymous"
+    return "elite"
+
+# 批量检测匿名级别: 通过代理访问回显请求头的地址（probe_server.py 的 /headers），
+# 按是否泄露本机IP、是否带有代理相关的请求头分为透明、匿名和高匿，并发上限与验证相同
+class AnonymityClassifier(ProxyVerifier):
+    # 批量发送的检测结果 [(ip, port, 匿名级别), ...]
+    anonymity_signal = pyqtSignal(list)
+    
+    def __init__(self, proxy_list, max_workers=10, proxy_type="socks5", **kwargs):
+        # 只需访问一个地址，固定使用异步引擎，不分阶段、不复用验证缓存；
+        # 按列表中记录的协议访问，从数据库提取的代理协议各不相同
+        kwargs.update(engine="asyncio", prefilter=False, cache=None, stored_protocol=True)
+        super().__init__(proxy_list, max_workers, proxy_type, **kwargs)
+        self.local_ip = None
+        self.pending_levels = []
+    
+    def run(self):
+        # 直接访问回显地址得到本机的出口IP，用于识别透明代理。
+        # 不使用系统代理设置，否则得到的可能是本程序设置的全局代理的出口IP
+        session = requests.Session()
+        session.trust_env = False
+        try:
+            response = session.get(self.anonymity_url, timeout=self.timeout)
+            self.local_ip = response.json().get("remote_addr")
+        except Exception as e:
+            self.log_signal.emit(f"无法访问请求头回显地址 {self.anonymity_url}: {str(e)}")
+            self.finished_signal.emit()
+            return
+        finally:
+            session.close()
+        self.log_signal.emit(f"开始检测匿名级别，本机出口IP: {self.local_ip}")
+        super().run()
+    
+    async def verify_proxy_async(self, ip, port, protocol):
+        """通过代理访问回显地址并判断匿名级别，访问失败的代理按无效处理"""
+        start_time = time.time()
+        try:
+            status, body = await asyncio.wait_for(
+                self.fetch_via_proxy(ip, port, protocol, self.anonymity_url, body_limit=ANONYMITY_BODY_BYTES),
+                self.current_timeout())
+            if status != 200:
+                return False, 0.0
+            echo = json.loads(body.decode("utf-8", "replace"))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False, 0.0
+        
+        level = classify_anonymity(echo.get("headers", {}), echo.get("remote_addr"), self.local_ip)
+        self.log(f"代理 {ip}:{port} ({protocol}) 匿名级别: {ANONYMITY_NAMES[level]}")
+        with self.lock:
+            self.pending_levels.append((ip, port, level))
+        return True, time.time() - start_time
+    
+    def flush(self):
+        with self.lock:
+            levels, self.pending_levels = self.pending_levels, []
+        if levels:
+            self.anonymity_signal.emit(levels)
+        super().flush()
+
+def make_soup(markup, parser=None):
+    """用指定的解析器（默认 HTML_PARSER）解析页面，解析器不可用时退回 html.parser"""
+    try:
+        return BeautifulSoup(markup, parser or HTML_PARSER)
+    except FeatureNotFound:
+        return BeautifulSoup(markup, "html.parser")
 
 # 代理爬虫线程
 class ProxyCrawler(QThread):
     update_signal = pyqtSignal(list)
     log_signal = pyqtSignal(str)
     
-    def __init__(self, source_type, proxy_type="socks5"):
+    # 代理源名称 -> (网站, 爬取方法)
+    SOURCES = {
+        "proxy-list-org": ("proxy-list.org", "crawl_proxy_list_org"),
+        "proxynova": ("proxynova.com", "crawl_proxynova"),
+        "freeproxy": ("freeproxy.world", "crawl_freeproxy_world"),
+        "proxydb": ("proxydb.net", "crawl_proxydb"),
+        "openproxy": ("openproxy.space", "crawl_openproxy"),
+        "premproxy": ("premproxy.com", "crawl_premproxy"),
+        "proxylistplus": ("list.proxylistplus.com", "crawl_proxylistplus"),
+        "free-proxy-list": ("free-proxy-list.net", "crawl_free_proxy_list"),
+        "geonode": ("geonode.com", "crawl_geonode"),
+        "proxyscrape": ("proxyscrape.com", "crawl_proxyscrape"),
+        "freedom": ("Freedom", "crawl_freedom"),
+        "hidemyass": ("HideMyAss", "crawl_hidemyass"),
+        "proxpn": ("ProXPN", "crawl_proxpn"),
+        "storm": ("Storm", "crawl_storm"),
+        "spys.one": ("spys.one", "crawl_spys_one"),
+        "proxy-daily": ("proxy-daily.com", "crawl_proxy_daily"),
+        "cool-proxy": ("cool-proxy.net", "crawl_cool_proxy"),
+        "proxy-list.download": ("proxy-list.download", "crawl_proxy_list_download"),
+        "proxyranker": ("proxyranker.com", "crawl_proxyranker"),
+    }
+    
+    def __init__(self, source_type, proxy_type="socks5", timeout=CRAWL_TIMEOUT, deadline=CRAWL_DEADLINE, pipeline=None,
+                 parser=None):
         super().__init__()
         self.source_type = source_type
         self.proxy_type = proxy_type
+        # 页面解析器，可选 "lxml"、"html.parser" 等 BeautifulSoup 支持的解析器
+        self.parser = parser or HTML_PARSER
+        # 设置后爬到的代理同时送入爬取-验证流水线
+        self.pipeline = pipeline
+        # 每个请求的超时，以及爬取所有源时的总时限（秒）
+        self.timeout = timeout
+        self.deadline = deadline
+        self.is_running = True
+    
+    def stop(self):
+        """停止爬取，不再等待未完成的源，已爬到但还没发出的代理丢弃"""
+        self.is_running = False
+        if self.pipeline is not None:
+            self.pipeline.finish()
     
     def run(self):
-        proxies = []
-        
-        if self.source_type == "proxy-list-org":
-            self.log_signal.emit(f"正在从 proxy-list.org 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxy_list_org())
-        elif self.source_type == "proxynova":
-            self.log_signal.emit(f"正在从 proxynova.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxynova())
-        elif self.source_type == "freeproxy":
-            self.log_signal.emit(f"正在从 freeproxy.world 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_freeproxy_world())
-        elif self.source_type == "proxydb":
-            self.log_signal.emit(f"正在从 proxydb.net 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxydb())
-        elif self.source_type == "openproxy":
-            self.log_signal.emit(f"正在从 openproxy.space 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_openproxy())
-        elif self.source_type == "premproxy":
-            self.log_signal.emit(f"正在从 premproxy.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_premproxy())
-        elif self.source_type == "proxylistplus":
-            self.log_signal.emit(f"正在从 list.proxylistplus.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxylistplus())
-        elif self.source_type == "free-proxy-list":
-            self.log_signal.emit(f"正在从 free-proxy-list.net 获取HTTP代理...")
-            proxies.extend(self.crawl_free_proxy_list())
-        elif self.source_type == "geonode":
-            self.log_signal.emit(f"正在从 geonode.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_geonode())
-        elif self.source_type == "proxyscrape":
-            self.log_signal.emit(f"正在从 proxyscrape.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxyscrape())
-        elif self.source_type == "freedom":
-            self.log_signal.emit(f"正在从 Freedom 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_freedom())
-        elif self.source_type == "hidemyass":
-            self.log_signal.emit(f"正在从 HideMyAss 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_hidemyass())
-        elif self.source_type == "proxpn":
-            self.log_signal.emit(f"正在从 ProXPN 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxpn())
-        elif self.source_type == "storm":
-            self.log_signal.emit(f"正在从 Storm 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_storm())
-        elif self.source_type == "spys.one":
-            self.log_signal.emit(f"正在从 spys.one 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_spys_one())
-        elif self.source_type == "proxy-daily":
-            self.log_signal.emit(f"正在从 proxy-daily.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxy_daily())
-        elif self.source_type == "cool-proxy":
-            self.log_signal.emit(f"正在从 cool-proxy.net 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_cool_proxy())
-        elif self.source_type == "proxy-list.download":
-            self.log_signal.emit(f"正在从 proxy-list.download 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxy_list_download())
-        elif self.source_type == "proxyranker":
-            self.log_signal.emit(f"正在从 proxyranker.com 获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxyranker())
-        elif self.source_type == "all-sources":
-            self.log_signal.emit(f"正在从所有源获取{self.proxy_type}代理...")
-            proxies.extend(self.crawl_proxy_list_org())
-            proxies.extend(self.crawl_proxynova())
-            proxies.extend(self.crawl_freeproxy_world())
-            proxies.extend(self.crawl_proxydb())
-            proxies.extend(self.crawl_openproxy())
-            proxies.extend(self.crawl_premproxy())
-            proxies.extend(self.crawl_proxylistplus())
-            
-            if self.proxy_type == "http":
-                proxies.extend(self.crawl_free_proxy_list())
-            
-            proxies.extend(self.crawl_geonode())
-            proxies.extend(self.crawl_proxyscrape())
-            proxies.extend(self.crawl_freedom())
-            proxies.extend(self.crawl_hidemyass())
-            proxies.extend(self.crawl_proxpn())
-            proxies.extend(self.crawl_storm())
-            proxies.extend(self.crawl_spys_one())
-            proxies.extend(self.crawl_proxy_daily())
-            proxies.extend(self.crawl_cool_proxy())
-            proxies.extend(self.crawl_proxy_list_download())
-            proxies.extend(self.crawl_proxyranker())
-        
-        # 为每个代理添加类型标记
+        try:
+            if self.source_type == "all-sources":
+                self.log_signal.emit(f"正在从所有源获取{self.proxy_type}代理...")
+                self.crawl_all_sources()
+            elif self.source_type in self.SOURCES:
+                site, method = self.SOURCES[self.source_type]
+                # free-proxy-list.net 只提供 HTTP 代理
+                proxy_type = "HTTP" if self.source_type == "free-proxy-list" else self.proxy_type
+                self.log_signal.emit(f"正在从 {site} 获取{proxy_type}代理...")
+                self.emit_proxies(getattr(self, method)())
+        finally:
+            if self.pipeline is not None:
+                self.pipeline.finish()
+    
+    def emit_proxies(self, proxies):
+        """为每个代理添加类型标记后发给界面，有流水线时同时送去验证，验证跟不上时在这里等待"""
+        if not self.is_running:
+            return
         typed_proxies = [(ip, port, self.proxy_type) for ip, port in proxies]
         self.update_signal.emit(typed_proxies)
+        if self.pipeline is not None:
+            for proxy in typed_proxies:
+                if not self.pipeline.put(proxy):
+                    break
+    
+    def crawl_all_sources(self):
+        """同时爬取所有源，每个源完成后立即把结果发给界面，
+        超过总时限仍未完成的源不再等待，结果丢弃"""
+        sources = [name for name in self.SOURCES if name != "free-proxy-list" or self.proxy_type == "http"]
+        deadline_at = time.monotonic() + self.deadline
+        started = time.monotonic()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(sources))
+        future_to_source = {executor.submit(self.timed_crawl, name): name for name in sources}
+        
+        proxies = []
+        stats = []
+        pending = set(future_to_source)
+        try:
+            # 定时醒来检查是否已停止或超过总时限
+            while pending and self.is_running:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = concurrent.futures.wait(pending, timeout=min(remaining, 0.5),
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = future_to_source[future]
+                    site = self.SOURCES[name][0]
+                    try:
+                        source_proxies, elapsed = future.result()
+                    except Exception as e:
+                        self.log_signal.emit(f"从 {site} 获取代理时出错: {str(e)}")
+                        continue
+                    proxies.extend(source_proxies)
+                    stats.append((site, len(source_proxies), elapsed))
+                    self.log_signal.emit(f"{site}: 获取 {len(source_proxies)} 个代理，用时 {elapsed:.1f}秒")
+                    if source_proxies:
+                        self.emit_proxies(source_proxies)
+            if pending:
+                missed = ', '.join(self.SOURCES[future_to_source[future]][0] for future in pending)
+                if self.is_running:
+                    self.log_signal.emit(f"超过 {self.deadline} 秒总时限，放弃未完成的源: {missed}")
+                else:
+                    self.log_signal.emit(f"爬取已停止，放弃未完成的源: {missed}")
+        finally:
+            # 未完成的请求在超时后自行结束，不再等待
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        empty = [site for site, count, _ in stats if count == 0]
+        self.log_signal.emit(f"所有源爬取结束，用时 {time.monotonic() - started:.1f}秒，"
+                             f"{len(stats)}/{len(sources)} 个源按时完成，共获取 {len(proxies)} 个代理"
+                             + (f"，没有获取到代理的源: {', '.join(empty)}" if empty else ""))
+        return proxies
+    
+    def timed_crawl(self, name):
+        """爬取单个源，返回 (代理列表, 用时)"""
+        started = time.monotonic()
+        proxies = getattr(self, self.SOURCES[name][1])()
+        return proxies, time.monotonic() - started
     
     def get_direct_session(self):
         """创建一个不使用代理的请求会话"""
@@ -366,8 +2610,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://proxy-list.org/english/index.php", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://proxy-list.org/english/index.php", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理列表
             proxy_elements = soup.select("div.table-wrap ul li.proxy")
@@ -400,8 +2644,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://www.proxynova.com/proxy-server-list/", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://www.proxynova.com/proxy-server-list/", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格行
             rows = soup.select("table#tbl_proxy_list tbody tr")
@@ -448,8 +2692,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://www.freeproxy.world/", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://www.freeproxy.world/", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             rows = soup.select("table.layui-table tbody tr")
@@ -478,8 +2722,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("http://proxydb.net/", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("http://proxydb.net/", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理列表
             proxy_elements = soup.select("table.table tbody tr")
@@ -509,8 +2753,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://openproxy.space/list", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://openproxy.space/list", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理列表
             proxy_elements = soup.select("table.table tbody tr")
@@ -539,8 +2783,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://premproxy.com/proxy-by-country/", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://premproxy.com/proxy-by-country/", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             rows = soup.select("table#proxylist tbody tr")
@@ -569,8 +2813,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://list.proxylistplus.com/Fresh-HTTP-Proxy-List-1", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://list.proxylistplus.com/Fresh-HTTP-Proxy-List-1", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             rows = soup.select("table.bg tr.cells")
@@ -599,8 +2843,8 @@ class ProxyCrawler(QThread):
         proxies = []
         try:
             session = self.get_direct_session()
-            response = session.get("https://free-proxy-list.net/", timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get("https://free-proxy-list.net/", timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             table = soup.find('table', id='proxylisttable')
@@ -639,7 +2883,7 @@ class ProxyCrawler(QThread):
             protocol = "http" if self.proxy_type == "http" else "socks5"
             url = f"https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&sort_by=lastChecked&sort_type=desc&filterUpTime=90&protocols={protocol}"
             
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             data = response.json()
             
             for proxy in data.get('data', []):
@@ -669,7 +2913,7 @@ class ProxyCrawler(QThread):
             protocol = "http" if self.proxy_type == "http" else "socks5"
             url = f"https://api.proxyscrape.com/v2/?request=getproxies&protocol={protocol}&timeout=10000&country=all"
             
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             proxy_list = response.text.strip().split('\r\n')
             
             for proxy in proxy_list:
@@ -699,7 +2943,7 @@ class ProxyCrawler(QThread):
             if self.proxy_type == "socks5":
                 url = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/socks5.txt"
                 
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             proxy_list = response.text.strip().split('\n')
             
             for proxy in proxy_list:
@@ -728,8 +2972,8 @@ class ProxyCrawler(QThread):
             # HideMyAss 代理列表页面
             url = "https://proxylist.hidemyass-freeproxy.com/proxy-list/"
             
-            response = session.get(url, timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get(url, timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             table = soup.find('table', class_='hma-table')
@@ -770,7 +3014,7 @@ class ProxyCrawler(QThread):
             # ProXPN 代理API
             url = "https://api.proxyscrape.com/?request=displayproxies&proxytype=all&country=all&anonymity=all&ssl=all&timeout=10000"
             
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             proxy_list = response.text.strip().split('\n')
             
             for proxy in proxy_list:
@@ -801,7 +3045,7 @@ class ProxyCrawler(QThread):
             if self.proxy_type == "http":
                 url = "https://www.proxy-list.download/api/v1/get?type=http"
                 
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             proxy_list = response.text.strip().split('\n')
             
             for proxy in proxy_list:
@@ -829,8 +3073,8 @@ class ProxyCrawler(QThread):
             url = "http://spys.one/free-proxy-list/"
             
             # 获取初始页面以获取表单数据
-            response = session.get(url, timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get(url, timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             proxy_table = soup.find('table', {'class': 'spy1x'})
@@ -863,8 +3107,8 @@ class ProxyCrawler(QThread):
             session = self.get_direct_session()
             url = "https://proxy-daily.com/"
             
-            response = session.get(url, timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get(url, timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理列表
             proxy_divs = soup.find_all('div', {'class': 'centeredProxyList'})
@@ -894,8 +3138,8 @@ class ProxyCrawler(QThread):
             session = self.get_direct_session()
             url = "https://cool-proxy.net/"
             
-            response = session.get(url, timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get(url, timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             proxy_table = soup.find('table', {'id': 'proxy_list'})
@@ -928,7 +3172,7 @@ class ProxyCrawler(QThread):
             protocol = "http" if self.proxy_type == "http" else "socks5"
             url = f"https://www.proxy-list.download/api/v1/get?type={protocol}"
             
-            response = session.get(url, timeout=15)
+            response = session.get(url, timeout=self.timeout)
             proxy_list = response.text.strip().split('\r\n')
             
             for proxy in proxy_list:
@@ -955,8 +3199,8 @@ class ProxyCrawler(QThread):
             session = self.get_direct_session()
             url = "https://proxyranker.com/"
             
-            response = session.get(url, timeout=15)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = session.get(url, timeout=self.timeout)
+            soup = make_soup(response.text, self.parser)
             
             # 查找代理表格
             proxy_table = soup.find('table', {'class': 'table'})
@@ -983,11 +3227,49 @@ class ProxyCrawler(QThread):
 
 # 主窗口类
 class ProxyManagerApp(QMainWindow):
+    # 测试选中代理的线程通过信号输出日志、通知结束
+    test_log_signal = pyqtSignal(str)
+    test_finished_signal = pyqtSignal()
+    
     def __init__(self):
         super().__init__()
+        self.local_ip = None  # 本机出口IP，测试代理时获取一次后缓存
+        self.local_ip_lock = threading.Lock()
+        self.test_log_signal.connect(self.log)
+        self.test_finished_signal.connect(self.enable_all_buttons)
         self.proxy_list = []
         self.valid_proxies = []  # 初始化有效代理列表
+        self.invalid_proxies = set()  # 本次验证中确认无效的代理
+        self.detected_protocols = {}  # 验证时自动识别出的协议
         self.db_manager = DatabaseManager()
+        self.verify_cache = VerificationCache()  # 最近的验证结果，有效期内不重复验证
+        # 验证设置，可在"验证设置"对话框中修改
+        self.verify_settings = {
+            "quorum": True,
+            "prefilter": True,
+            "tcp_limit": 1000,
+            "handshake_limit": 500,
+            "detect_protocol": False,
+            "deadline": 10,
+            "timeout": 5,
+            "adaptive_timeout": False,
+            "timeout_factor": 3.0,
+            "timeout_floor": 1.0,
+            "test_urls": list(DEFAULT_TEST_URLS),
+            "expect_token": "",
+            "max_body_bytes": MAX_BODY_BYTES,
+            "circuit_breaker": True,
+            "auto_concurrency": False,
+            "processes": os.cpu_count() or 1,
+            "coordinator_host": "127.0.0.1",
+            "coordinator_port": 8765,
+            "local_workers": 2,
+            "worker_token": "",
+            "cache_good_ttl": 10,
+            "cache_dead_ttl": 60,
+            "anonymity_url": "",
+            "connect_target": DEFAULT_CONNECT_TARGET
+        }
         self.proxy_sources = [
             "proxy-list-org", 
             "proxynova", 
@@ -1215,6 +3497,10 @@ class ProxyManagerApp(QMainWindow):
         self.crawl_button = QPushButton("爬取代理")
         self.crawl_button.clicked.connect(self.crawl_proxies)
         
+        # 边爬取边验证，有效代理随时写入数据库
+        self.crawl_verify_button = QPushButton("爬取并验证")
+        self.crawl_verify_button.clicked.connect(self.crawl_and_verify)
+        
         # 手动添加代理
         add_proxy_layout = QHBoxLayout()
         self.add_proxy_input = QLineEdit()
@@ -1233,35 +3519,69 @@ class ProxyManagerApp(QMainWindow):
         import_export_layout.addWidget(self.import_button)
         import_export_layout.addWidget(self.export_button)
         
-        # 线程数设置
+        # 验证引擎选择
+        engine_layout = QHBoxLayout()
+        engine_label = QLabel("验证引擎:")
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(["asyncio", "threads", "processes", "distributed"])
+        self.engine_combo.setToolTip(f"asyncio: 单线程事件循环，可同时验证数千个代理\nthreads: 线程池，最多{MAX_THREAD_WORKERS}个线程\n"
+                                     f"processes: 多个进程各运行一个 asyncio 验证器，并发数平均分配，可利用多核\n"
+                                     f"distributed: 本机作为协调节点，把代理分批交给本地和其他主机上的工作节点验证")
+        
+        # 添加验证设置按钮
+        verify_settings_btn = QPushButton("设置")
+        verify_settings_btn.clicked.connect(self.show_verifier_settings)
+        
+        engine_layout.addWidget(engine_label)
+        engine_layout.addWidget(self.engine_combo)
+        engine_layout.addWidget(verify_settings_btn)
+        
+        # 并发数设置
         thread_layout = QHBoxLayout()
-        thread_label = QLabel("验证线程数:")
+        thread_label = QLabel("验证并发数:")
         self.thread_spinbox = QSpinBox()
-        self.thread_spinbox.setRange(1, 50)
-        self.thread_spinbox.setValue(10)
-        self.thread_spinbox.setToolTip("设置验证代理时使用的线程数量")
+        self.thread_spinbox.setRange(1, 5000)
+        self.thread_spinbox.setValue(200)
+        self.thread_spinbox.setToolTip(f"设置验证代理时同时进行的探测数量，threads 引擎最多使用 {MAX_THREAD_WORKERS} 个线程")
         thread_layout.addWidget(thread_label)
         thread_layout.addWidget(self.thread_spinbox)
+        # 自动调节并发时显示当前的并发数
+        self.concurrency_label = QLabel("")
+        thread_layout.addWidget(self.concurrency_label)
         
         # 代理筛选
         filter_layout = QHBoxLayout()
         filter_label = QLabel("筛选类型:")
         self.filter_combo = QComboBox()
-        self.filter_combo.addItems(["全部", "socks5", "http"])
+        self.filter_combo.addItems(["全部"] + PROXY_PROTOCOLS)
         self.filter_combo.currentIndexChanged.connect(self.filter_proxies)
         filter_layout.addWidget(filter_label)
         filter_layout.addWidget(self.filter_combo)
         
+        # 提取数据库中的代理时按匿名级别筛选，使用批量检测保存的结果
+        anonymity_layout = QHBoxLayout()
+        anonymity_label = QLabel("匿名级别:")
+        self.anonymity_combo = QComboBox()
+        self.anonymity_combo.addItem("全部", None)
+        for level, name in ANONYMITY_NAMES.items():
+            self.anonymity_combo.addItem(name, level)
+        self.anonymity_combo.setToolTip("提取数据库中IP时只提取该匿名级别的代理")
+        anonymity_layout.addWidget(anonymity_label)
+        anonymity_layout.addWidget(self.anonymity_combo)
+        
         # 统计信息
         self.stats_label = QLabel("统计: 0个代理 (0 SOCKS5, 0 HTTP)")
         
         left_layout.addLayout(source_layout)
         left_layout.addLayout(proxy_type_layout)
         left_layout.addWidget(self.crawl_button)
+        left_layout.addWidget(self.crawl_verify_button)
         left_layout.addLayout(add_proxy_layout)
         left_layout.addLayout(import_export_layout)
+        left_layout.addLayout(engine_layout)
         left_layout.addLayout(thread_layout)
         left_layout.addLayout(filter_layout)
+        left_layout.addLayout(anonymity_layout)
         left_layout.addWidget(self.stats_label)
         left_layout.addStretch()
         
@@ -1272,6 +3592,11 @@ class ProxyManagerApp(QMainWindow):
         self.proxy_listwidget = QListWidget()
         self.proxy_listwidget.setContextMenuPolicy(Qt.CustomContextMenu)
         self.proxy_listwidget.customContextMenuRequested.connect(self.show_context_menu)
+        # 列表增删代理后重建 "ip:port" 到列表项的索引，更新验证结果时不必遍历列表
+        self.item_index = None
+        for model_signal in (self.proxy_listwidget.model().rowsInserted, self.proxy_listwidget.model().rowsRemoved,
+                             self.proxy_listwidget.model().modelReset):
+            model_signal.connect(self.invalidate_item_index)
         
         right_layout.addWidget(list_label)
         right_layout.addWidget(self.proxy_listwidget)
@@ -1304,6 +3629,9 @@ class ProxyManagerApp(QMainWindow):
         self.verify_location_button = QPushButton("验证IP地理位置")
         self.verify_location_button.clicked.connect(self.verify_ip_locations)
         
+        self.anonymity_button = QPushButton("检测匿名级别")
+        self.anonymity_button.clicked.connect(self.classify_anonymity_levels)
+        
         self.clear_list_button = QPushButton("清空列表")
         self.clear_list_button.clicked.connect(self.clear_proxy_list)
         
@@ -1331,15 +3659,29 @@ class ProxyManagerApp(QMainWindow):
         """)
         self.deduplicate_db_button.clicked.connect(self.deduplicate_database)
         
+        # 开启后在后台持续复查数据库中的代理
+        self.monitor_button = QPushButton("后台监控")
+        self.monitor_button.setCheckable(True)
+        self.monitor_button.toggled.connect(self.toggle_monitor)
+        
+        # 验证进行中才可用，停止后保留已得到的结果
+        self.stop_verify_button = QPushButton("停止验证")
+        self.stop_verify_button.setProperty("style", "warning")
+        self.stop_verify_button.setEnabled(False)
+        self.stop_verify_button.clicked.connect(self.stop_verification)
+        
         # 添加按钮到下部分布局
         bottom_layout.addWidget(self.verify_list_button)
         bottom_layout.addWidget(self.verify_db_button)
+        bottom_layout.addWidget(self.stop_verify_button)
         bottom_layout.addWidget(self.export_db_button)
         bottom_layout.addWidget(self.test_proxy_button)
         bottom_layout.addWidget(self.verify_location_button)
+        bottom_layout.addWidget(self.anonymity_button)
         bottom_layout.addWidget(self.clear_list_button)
         bottom_layout.addWidget(self.unset_all_proxy_button)
         bottom_layout.addWidget(self.deduplicate_db_button)
+        bottom_layout.addWidget(self.monitor_button)
         
         # 设置进度条样式和高度
         self.progress_bar.setFixedHeight(15)
@@ -1511,6 +3853,13 @@ class ProxyManagerApp(QMainWindow):
         self.verifier = None
         self.crawler = None
         
+        # 后台监控: 定时复查数据库中到期的代理，有手动验证时让路
+        self.monitor_verifier = None
+        self.monitor_results = []
+        self.monitor_timer = QTimer(self)
+        self.monitor_timer.setInterval(MONITOR_TICK * 1000)
+        self.monitor_timer.timeout.connect(self.run_monitor_round)
+        
         # 显示窗口
         self.show()
         
@@ -1521,6 +3870,11 @@ class ProxyManagerApp(QMainWindow):
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         self.log_textedit.append(f"[{timestamp}] {message}")
     
+    def log_many(self, messages):
+        """一次追加多条日志，减少界面刷新次数"""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.log_textedit.append("\n".join(f"[{timestamp}] {message}" for message in messages))
+    
     def crawl_proxies(self):
         """爬取代理"""
         self.disable_all_buttons()  # 禁用所有按钮
@@ -1537,16 +3891,14 @@ class ProxyManagerApp(QMainWindow):
         self.crawler.start()
     
     def update_proxy_list(self, proxies):
+        """把爬取到的代理加入列表，爬取所有源时每个源完成后调用一次"""
         count = 0
+        # 已有代理的索引，避免每个新代理都遍历一次列表
+        existing = {(existing_ip, existing_port) for existing_ip, existing_port, _ in self.proxy_list}
         for ip, port, proxy_type in proxies:
             # 检查是否已存在相同IP和端口的代理
-            exists = False
-            for i, (existing_ip, existing_port, _) in enumerate(self.proxy_list):
-                if existing_ip == ip and existing_port == port:
-                    exists = True
-                    break
-            
-            if not exists:
+            if (ip, port) not in existing:
+                existing.add((ip, port))
                 self.proxy_list.append((ip, port, proxy_type))
                 item_text = f"{ip}:{port} [{proxy_type}]"
                 
@@ -1560,6 +3912,74 @@ class ProxyManagerApp(QMainWindow):
         self.log(f"成功添加 {count} 个新代理")
         self.update_stats()
     
+    def crawl_and_verify(self):
+        """爬取代理并同时验证: 爬到的代理去重后进入有界队列，验证器边取边验证，有效代理随时写入数据库"""
+        self.disable_all_buttons()
+        
+        source = self.source_combo.currentText()
+        proxy_type = self.proxy_type_combo.currentText()
+        self.valid_proxies = []
+        self.invalid_proxies = set()
+        self.detected_protocols = {}
+        self.pipeline_inserted = 0
+        self.pipeline = ProxyPipeline()
+        
+        self.crawler = ProxyCrawler(source, proxy_type, pipeline=self.pipeline)
+        self.crawler.update_signal.connect(self.update_proxy_list)
+        self.crawler.log_signal.connect(self.log)
+        
+        # 验证结果先由 save_pipeline_results 把有效代理写入数据库，再和其他验证一样记录验证结果
+        self.verifier = self.create_verifier([], pipeline=self.pipeline)
+        self.verifier.batch_signal.disconnect(self.update_proxy_status_batch)
+        self.verifier.batch_signal.connect(self.save_pipeline_results)
+        self.verifier.cached_signal.connect(lambda results: self.save_pipeline_results(results, cached=True))
+        self.verifier.finished.connect(self.on_pipeline_finished)
+        
+        if self.engine_combo.currentText() != "asyncio":
+            self.log("爬取并验证只支持 asyncio 引擎，本次使用 asyncio 引擎")
+        self.log(f"开始从 {source} 爬取{proxy_type}代理并同时验证...")
+        self.verifier.start()
+        self.crawler.start()
+    
+    def save_pipeline_results(self, results, cached=False):
+        """把流水线中验证有效的代理随时写入数据库，新验证的结果随后记入数据库和缓存，
+        来自缓存的结果由 create_verifier 连接的处理函数更新界面"""
+        valid = [(ip, port, self.valid_proxy_protocol(ip, port), response_time)
+                 for ip, port, is_valid, response_time in results if is_valid]
+        if valid:
+            self.pipeline_inserted += self.db_manager.add_proxies(valid)
+        if not cached:
+            self.update_proxy_status_batch(results)
+    
+    def on_pipeline_finished(self):
+        """爬取并验证结束后的处理"""
+        self.remove_invalid_items()
+        self.proxy_list = self.remaining_proxies()
+        
+        state = "已停止" if self.verifier.cancelled else "完成"
+        self.log(f"爬取并验证{state}: 爬到 {self.pipeline.accepted} 个代理（另有 {self.pipeline.duplicates} 个重复），"
+                 f"有效 {len(self.valid_proxies)} 个，无效 {len(self.invalid_proxies)} 个，"
+                 f"新增到数据库 {self.pipeline_inserted} 个")
+        self.update_stats()
+        # 验证中途停止时爬虫可能还在运行，等它结束后再启用按钮，避免再次爬取时替换仍在运行的爬虫线程
+        self.crawler.finished.connect(self.enable_all_buttons)
+        if self.crawler.isRunning():
+            self.log("等待爬虫结束...")
+            self.crawler.stop()
+        else:
+            self.enable_all_buttons()
+    
+    def remove_invalid_items(self):
+        """从列表控件中移除标记为无效的代理"""
+        items_to_remove = []
+        for i in range(self.proxy_listwidget.count()):
+            item = self.proxy_listwidget.item(i)
+            if "[无效]" in item.text():
+                items_to_remove.append(item)
+        
+        for item in items_to_remove:
+            self.proxy_listwidget.takeItem(self.proxy_listwidget.row(item))
+    
     def verify_list_proxies(self):
         """验证列表中的代理"""
         if not self.proxy_list:
@@ -1570,16 +3990,50 @@ class ProxyManagerApp(QMainWindow):
         
         self.log("开始验证代理列表...")
         self.valid_proxies = []  # 重置有效代理列表
+        self.invalid_proxies = set()
+        self.detected_protocols = {}
         self.total_proxies = len(self.proxy_list)  # 记录总代理数
         
-        self.verifier = ProxyVerifier(self.proxy_list, self.thread_spinbox.value(), self.proxy_type_combo.currentText())
-        self.verifier.update_signal.connect(self.update_proxy_status)
-        self.verifier.progress_signal.connect(self.update_progress)
-        self.verifier.log_signal.connect(self.log)
+        self.verifier = self.create_verifier(self.proxy_list)
         self.verifier.finished.connect(self.on_list_verification_finished)  # 连接到列表验证完成处理函数
         
         self.verifier.start()
 
+    def create_verifier(self, proxies, **options):
+        """按界面上的设置创建验证线程并连接信号，options 为额外的验证参数"""
+        # 手动验证优先，停止正在进行的后台复查，已得到的结果照常保存
+        if self.monitor_verifier is not None and self.monitor_verifier.isRunning():
+            self.monitor_verifier.stop()
+        # 先用数据库中的验证时间补充缓存，上次运行程序时验证过的代理同样可以跳过
+        verifier = ProxyVerifier(proxies, self.thread_spinbox.value(), self.proxy_type_combo.currentText(),
+                                 engine=self.engine_combo.currentText(), cache=self.verify_cache,
+                                 **self.verify_settings, **options)
+        self.verify_cache.load(verifier.cache_fingerprint(), self.db_manager.get_recent_checks())
+        verifier.batch_signal.connect(self.update_proxy_status_batch)
+        verifier.cached_signal.connect(lambda results: self.update_proxy_status_batch(results, cached=True))
+        verifier.progress_signal.connect(self.update_progress)
+        verifier.log_batch_signal.connect(self.log_many)
+        verifier.protocol_signal.connect(self.update_proxy_protocols)
+        verifier.concurrency_signal.connect(self.update_concurrency)
+        self.concurrency_label.setText("")
+        verifier.started.connect(lambda: self.stop_verify_button.setEnabled(True))
+        verifier.finished.connect(lambda: self.stop_verify_button.setEnabled(False))
+        return verifier
+    
+    def stop_verification(self):
+        """停止正在进行的验证，已验证的结果照常保存"""
+        if self.verifier is not None and self.verifier.isRunning():
+            self.log("正在停止验证...")
+            self.stop_verify_button.setEnabled(False)
+            self.verifier.stop()
+    
+    def remaining_proxies(self):
+        """验证结束后保留的代理: 去掉无效的，中途停止时未验证的代理也保留"""
+        # 按记录的协议验证时，列表中的协议就是验证用的协议
+        valid = set() if self.verifier.stored_protocol else {(ip, port) for ip, port, _ in self.valid_proxies}
+        return [(ip, port, self.valid_proxy_protocol(ip, port) if (ip, port) in valid else proxy_type)
+                for ip, port, proxy_type in self.proxy_list if (ip, port) not in self.invalid_proxies]
+
     def on_list_verification_finished(self):
         """列表验证完成后的处理"""
         invalid_count = self.total_proxies - len(self.valid_proxies)
@@ -1588,31 +4042,32 @@ class ProxyManagerApp(QMainWindow):
         inserted_count = 0
         for ip, port, response_time in self.valid_proxies:
             try:
-                if self.db_manager.add_proxy(ip, port, self.proxy_type_combo.currentText(), response_time):
+                if self.db_manager.add_proxy(ip, port, self.valid_proxy_protocol(ip, port), response_time):
                     inserted_count += 1
             except Exception as e:
                 self.log(f"添加代理到数据库失败 {ip}:{port} - {str(e)}")
         
         # 显示验证结果
-        QMessageBox.information(self, "验证完成", 
-            f"验证完成！\n"
-            f"有效代理：{len(self.valid_proxies)} 个\n"
-            f"无效代理：{invalid_count} 个\n"
-            f"新增到数据库：{inserted_count} 个")
+        if self.verifier.cancelled:
+            unverified_count = self.total_proxies - len(self.valid_proxies) - len(self.invalid_proxies)
+            QMessageBox.information(self, "验证已停止", 
+                f"验证已停止！\n"
+                f"有效代理：{len(self.valid_proxies)} 个\n"
+                f"无效代理：{len(self.invalid_proxies)} 个\n"
+                f"未验证代理：{unverified_count} 个\n"
+                f"新增到数据库：{inserted_count} 个")
+        else:
+            QMessageBox.information(self, "验证完成", 
+                f"验证完成！\n"
+                f"有效代理：{len(self.valid_proxies)} 个\n"
+                f"无效代理：{invalid_count} 个\n"
+                f"新增到数据库：{inserted_count} 个")
         
         # 清理列表中的无效代理
-        items_to_remove = []
-        for i in range(self.proxy_listwidget.count()):
-            item = self.proxy_listwidget.item(i)
-            if "[无效]" in item.text():
-                items_to_remove.append(item)
-        
-        # 从列表中移除无效代理
-        for item in items_to_remove:
-            self.proxy_listwidget.takeItem(self.proxy_listwidget.row(item))
+        self.remove_invalid_items()
         
         # 更新代理列表
-        self.proxy_list = [(ip, port, self.proxy_type_combo.currentText()) for ip, port, _ in self.valid_proxies]
+        self.proxy_list = self.remaining_proxies()
         
         self.log(f"验证完成，保留了 {len(self.valid_proxies)} 个有效代理，新增到数据库 {inserted_count} 个")
         self.update_stats()
@@ -1622,12 +4077,15 @@ class ProxyManagerApp(QMainWindow):
         """验证数据库中的所有代理"""
         self.disable_all_buttons()  # 禁用所有按钮
         
-        # 获取数据库中的所有代理
-        proxies = self.db_manager.get_all_proxies()
+        # 获取数据库中的代理，按验证价值排序，有用的结果在验证开始后很快就能得到
+        proxies, skipped_count = self.db_manager.get_proxies_by_priority()
         if not proxies:
             QMessageBox.information(self, "提示", "数据库中没有代理")
             self.enable_all_buttons()  # 重新启用所有按钮
             return
+        if skipped_count:
+            self.log(f"跳过 {skipped_count} 个连续失败 {DEAD_FAIL_STREAK} 次以上的代理，"
+                     f"只抽样复查其中 {DEAD_SAMPLE_RATIO:.0%}")
         
         # 清空当前列表
         self.clear_proxy_list()
@@ -1640,15 +4098,15 @@ class ProxyManagerApp(QMainWindow):
         
         self.log(f"从数据库导入了 {len(proxies)} 个代理到列表")
             
-        self.log("开始验证数据库中的代理...")
+        self.log("开始按优先级验证数据库中的代理...")
         self.valid_proxies = []  # 重置有效代理列表
+        self.invalid_proxies = set()
+        self.detected_protocols = {}
         self.total_proxies = len(proxies)  # 记录总代理数
         
         # 创建验证线程
-        self.verifier = ProxyVerifier(proxies, self.thread_spinbox.value(), self.proxy_type_combo.currentText())
-        self.verifier.update_signal.connect(self.update_proxy_status)
-        self.verifier.progress_signal.connect(self.update_progress)
-        self.verifier.log_signal.connect(self.log)
+        # 每个代理按数据库中记录的协议验证
+        self.verifier = self.create_verifier(proxies, stored_protocol=True)
         self.verifier.finished.connect(self.on_db_verification_finished)
         
         # 开始验证
@@ -1658,74 +4116,207 @@ class ProxyManagerApp(QMainWindow):
         """数据库验证完成后的处理"""
         invalid_count = self.total_proxies - len(self.valid_proxies)
         
+        cancelled = self.verifier.cancelled
+        
         # 显示验证结果
-        QMessageBox.information(self, "验证完成", 
-            f"验证完成！\n有效代理：{len(self.valid_proxies)} 个\n无效代理：{invalid_count} 个")
+        if cancelled:
+            unverified_count = self.total_proxies - len(self.valid_proxies) - len(self.invalid_proxies)
+            QMessageBox.information(self, "验证已停止", 
+                f"验证已停止！\n有效代理：{len(self.valid_proxies)} 个\n无效代理：{len(self.invalid_proxies)} 个\n"
+                f"未验证代理：{unverified_count} 个（保留在数据库中）")
+        else:
+            QMessageBox.information(self, "验证完成", 
+                f"验证完成！\n有效代理：{len(self.valid_proxies)} 个\n无效代理：{invalid_count} 个")
         
         # 清理列表中的无效代理
-        items_to_remove = []
-        for i in range(self.proxy_listwidget.count()):
-            item = self.proxy_listwidget.item(i)
-            if "[无效]" in item.text():
-                items_to_remove.append(item)
-        
-        # 从列表中移除无效代理
-        for item in items_to_remove:
-            self.proxy_listwidget.takeItem(self.proxy_listwidget.row(item))
+        self.remove_invalid_items()
         
         # 更新代理列表
-        self.proxy_list = [(ip, port, self.proxy_type_combo.currentText()) for ip, port, _ in self.valid_proxies]
+        self.proxy_list = self.remaining_proxies()
         
-        # 清空数据库并重新添加有效代理
-        self.db_manager.clear_all_proxies()
-        for ip, port, response_time in self.valid_proxies:
-            self.db_manager.add_proxy(ip, port, self.proxy_type_combo.currentText(), response_time)
-        
-        self.log(f"数据库验证完成，保存了 {len(self.valid_proxies)} 个有效代理")
+        # 验证结果已随批量结果写入数据库，删除确认无效的代理，
+        # 有效的代理保留验证历史，未验证的代理（中途停止或抽样时跳过的）保持原样
+        self.db_manager.delete_proxies(sorted(self.invalid_proxies))
+        if cancelled:
+            self.log(f"数据库验证已停止，删除了 {len(self.invalid_proxies)} 个无效代理，其余代理保留")
+        else:
+            self.log(f"数据库验证完成，保留 {len(self.valid_proxies)} 个有效代理，删除了 {len(self.invalid_proxies)} 个无效代理")
         self.update_stats()
         self.enable_all_buttons()
     
-    def update_proxy_status(self, ip, port, is_valid, response_time):
-        """更新代理状态"""
-        if is_valid:
-            self.valid_proxies.append((ip, port, response_time))
-            # 更新列表项显示
-            for i in range(self.proxy_listwidget.count()):
-                item = self.proxy_listwidget.item(i)
-                item_text = item.text()
-                if item_text.startswith(f"{ip}:{port}"):
-                    # 移除可能存在的旧状态标记
-                    base_text = item_text.split(" [")[0]
-                    proxy_type = item_text.split(" [")[1].split("]")[0]
-                    # 添加新的状态标记
-                    item.setText(f"{base_text} [{proxy_type}] [有效][响应时间:{response_time:.2f}秒]")
-                    item.setForeground(QColor("#2ecc71"))  # 设置为绿色
-                    break
+    def classify_anonymity_levels(self):
+        """批量检测列表中代理的匿名级别并保存到数据库"""
+        if not self.proxy_list:
+            QMessageBox.warning(self, "警告", "代理列表为空")
+            return
+        if not self.verify_settings["anonymity_url"]:
+            QMessageBox.warning(self, "警告", "请先在\"验证设置\"中填写请求头回显地址（可用 probe_server.py 的 /headers）")
+            return
+        
+        self.disable_all_buttons()
+        if self.monitor_verifier is not None and self.monitor_verifier.isRunning():
+            self.monitor_verifier.stop()
+        self.anonymity_counts = {level: 0 for level in ANONYMITY_NAMES}
+        self.anonymity_unsaved = 0
+        self.log(f"开始检测 {len(self.proxy_list)} 个代理的匿名级别...")
+        
+        self.verifier = AnonymityClassifier(self.proxy_list, self.thread_spinbox.value(),
+                                            self.proxy_type_combo.currentText(), **self.verify_settings)
+        self.verifier.anonymity_signal.connect(self.update_proxy_anonymity)
+        self.verifier.progress_signal.connect(self.update_progress)
+        self.verifier.log_signal.connect(self.log)
+        self.verifier.log_batch_signal.connect(self.log_many)
+        self.verifier.protocol_signal.connect(self.update_proxy_protocols)
+        self.verifier.started.connect(lambda: self.stop_verify_button.setEnabled(True))
+        self.verifier.finished.connect(lambda: self.stop_verify_button.setEnabled(False))
+        self.verifier.finished.connect(self.on_anonymity_finished)
+        self.verifier.start()
+    
+    def update_proxy_anonymity(self, results):
+        """保存匿名级别并在列表中标出，results 为 [(ip, port, 匿名级别), ...]"""
+        items = self.proxy_items()
+        for ip, port, level in results:
+            item = items.get(f"{ip}:{port}")
+            if item is not None:
+                base_text, _, rest = item.text().partition(" [")
+                # 去掉之前检测的结果后再标出新的级别
+                for name in ANONYMITY_NAMES.values():
+                    rest = rest.replace(f"[{name}]", "")
+                item.setText(f"{base_text} [{rest}[{ANONYMITY_NAMES[level]}]")
+        for _, _, level in results:
+            self.anonymity_counts[level] += 1
+        # 只更新数据库中已有的代理，列表中未保存过的代理只在列表中标出
+        self.anonymity_unsaved += len(results) - self.db_manager.update_proxy_anonymity_batch(results)
+    
+    def on_anonymity_finished(self):
+        counts = "，".join(f"{name} {self.anonymity_counts[level]} 个" for level, name in ANONYMITY_NAMES.items())
+        failed_count = self.verifier.verified_count - sum(self.anonymity_counts.values())
+        self.log(f"匿名级别检测{'已停止' if self.verifier.cancelled else '完成'}: {counts}，无法访问回显地址 {failed_count} 个")
+        if self.anonymity_unsaved:
+            self.log(f"其中 {self.anonymity_unsaved} 个代理不在数据库中，匿名级别只在列表中标出，没有保存")
+        self.enable_all_buttons()
+    
+    def toggle_monitor(self, enabled):
+        """开启或关闭后台监控"""
+        if enabled:
+            self.log(f"后台监控已开启: 有效代理每 {MONITOR_HEALTHY_INTERVAL // 60} 分钟复查一次，"
+                     f"失败的代理从 {MONITOR_RETRY_BASE // 60} 分钟起按失败次数加倍间隔，最长 {MONITOR_RETRY_CAP // 3600} 小时")
+            self.monitor_timer.start()
+            self.run_monitor_round()
         else:
-            # 更新列表项显示为无效
+            self.monitor_timer.stop()
+            if self.monitor_verifier is not None and self.monitor_verifier.isRunning():
+                self.monitor_verifier.stop()
+            self.log("后台监控已关闭")
+    
+    def run_monitor_round(self):
+        """复查一批到期的代理，上一轮未结束或正在手动验证时跳过"""
+        if self.monitor_verifier is not None and self.monitor_verifier.isRunning():
+            return
+        if self.verifier is not None and self.verifier.isRunning():
+            return
+        proxies = self.db_manager.get_due_proxies()
+        if not proxies:
+            return
+        
+        # 后台复查固定使用异步引擎，按数据库中记录的协议验证，只写数据库，不改动界面上的列表和按钮
+        self.monitor_results = []
+        settings = dict(self.verify_settings, detect_protocol=False, stored_protocol=True)
+        self.monitor_verifier = ProxyVerifier(proxies, self.thread_spinbox.value(), self.proxy_type_combo.currentText(),
+                                              engine="asyncio", **settings)
+        self.monitor_verifier.batch_signal.connect(self.on_monitor_results)
+        self.monitor_verifier.finished.connect(self.on_monitor_finished)
+        self.monitor_verifier.start()
+    
+    def on_monitor_results(self, results):
+        """保存后台复查的结果"""
+        self.monitor_results.extend(results)
+        self.db_manager.update_proxy_status_batch(results)
+        self.verify_cache.store(self.monitor_verifier.cache_fingerprint(), results)
+    
+    def on_monitor_finished(self):
+        valid_count = sum(1 for _, _, is_valid, _ in self.monitor_results if is_valid)
+        removed_count = self.db_manager.prune_dead_proxies()
+        self.log(f"后台监控: 复查 {len(self.monitor_results)} 个代理，有效 {valid_count} 个，"
+                 f"无效 {len(self.monitor_results) - valid_count} 个，删除了 {removed_count} 个连续失败 {MAX_FAIL_STREAK} 次的代理")
+    
+    def valid_proxy_protocol(self, ip, port):
+        """验证后保存代理时使用的协议，自动识别过的代理使用识别结果"""
+        return self.detected_protocols.get((ip, port), self.proxy_type_combo.currentText())
+    
+    def invalidate_item_index(self, *args):
+        self.item_index = None
+    
+    def proxy_items(self):
+        """返回 "ip:port" 到列表项的索引，列表改变后第一次使用时重建"""
+        if self.item_index is None:
+            self.item_index = {}
             for i in range(self.proxy_listwidget.count()):
                 item = self.proxy_listwidget.item(i)
-                item_text = item.text()
-                if item_text.startswith(f"{ip}:{port}"):
-                    # 移除可能存在的旧状态标记
-                    base_text = item_text.split(" [")[0]
-                    proxy_type = item_text.split(" [")[1].split("]")[0]
-                    # 添加无效标记
-                    item.setText(f"{base_text} [{proxy_type}] [无效]")
-                    item.setForeground(QColor("#e74c3c"))  # 设置为红色
-                    break
+                self.item_index.setdefault(item.text().split(" [")[0], item)
+        return self.item_index
+    
+    def update_proxy_protocols(self, protocols):
+        """批量更新自动识别出的代理协议，protocols 为 [(ip, port, protocol), ...]"""
+        changed = {(ip, port): protocol for ip, port, protocol in protocols}
+        self.detected_protocols.update(changed)
+        self.proxy_list = [(ip, port, changed.get((ip, port), proxy_type)) for ip, port, proxy_type in self.proxy_list]
+        items = self.proxy_items()
+        for (ip, port), protocol in changed.items():
+            item = items.get(f"{ip}:{port}")
+            if item is not None:
+                base_text, rest = item.text().split(" [", 1)
+                item.setText(f"{base_text} [{protocol}]" + rest.split("]", 1)[1])
+        self.db_manager.update_proxy_protocol_batch(protocols)
+    
+    def update_proxy_status(self, ip, port, is_valid, response_time):
+        """更新代理状态"""
+        self.update_proxy_status_batch([(ip, port, is_valid, response_time)])
+    
+    def update_proxy_status_batch(self, results, cached=False):
+        """批量更新代理状态，results 为 [(ip, port, is_valid, response_time), ...]，
+        cached 为 True 时结果来自缓存，只更新界面，不改动数据库中的验证时间"""
+        items = self.proxy_items()
+        
+        for ip, port, is_valid, response_time in results:
+            if is_valid:
+                self.valid_proxies.append((ip, port, response_time))
+            else:
+                self.invalid_proxies.add((ip, port))
+            
+            item = items.get(f"{ip}:{port}")
+            if item is None:
+                continue
+            # 移除可能存在的旧状态标记
+            item_text = item.text()
+            base_text = item_text.split(" [")[0]
+            proxy_type = item_text.split(" [")[1].split("]")[0]
+            cached_mark = "[缓存]" if cached else ""
+            if is_valid:
+                # 添加新的状态标记
+                item.setText(f"{base_text} [{proxy_type}] [有效][响应时间:{response_time:.2f}秒]{cached_mark}")
+                item.setForeground(QColor("#2ecc71"))  # 设置为绿色
+            else:
+                # 添加无效标记
+                item.setText(f"{base_text} [{proxy_type}] [无效]{cached_mark}")
+                item.setForeground(QColor("#e74c3c"))  # 设置为红色
         
-        # 更新数据库中的代理状态
-        self.db_manager.update_proxy_status(ip, port, is_valid, response_time)
+        if cached:
+            return
+        # 更新数据库中的代理状态，并记入缓存
+        self.db_manager.update_proxy_status_batch(results)
+        self.verify_cache.store(self.verifier.cache_fingerprint(), results)
 
     def disable_all_buttons(self):
         """禁用所有操作按钮"""
         self.crawl_button.setEnabled(False)
+        self.crawl_verify_button.setEnabled(False)
         self.verify_list_button.setEnabled(False)
         self.verify_db_button.setEnabled(False)
         self.export_db_button.setEnabled(False)
         self.test_proxy_button.setEnabled(False)
         self.verify_location_button.setEnabled(False)
+        self.anonymity_button.setEnabled(False)
         self.clear_list_button.setEnabled(False)
         self.unset_all_proxy_button.setEnabled(False)
         self.deduplicate_db_button.setEnabled(False)
@@ -1736,11 +4327,13 @@ class ProxyManagerApp(QMainWindow):
     def enable_all_buttons(self):
         """启用所有操作按钮"""
         self.crawl_button.setEnabled(True)
+        self.crawl_verify_button.setEnabled(True)
         self.verify_list_button.setEnabled(True)
         self.verify_db_button.setEnabled(True)
         self.export_db_button.setEnabled(True)
         self.test_proxy_button.setEnabled(True)
         self.verify_location_button.setEnabled(True)
+        self.anonymity_button.setEnabled(True)
         self.clear_list_button.setEnabled(True)
         self.unset_all_proxy_button.setEnabled(True)
         self.deduplicate_db_button.setEnabled(True)
@@ -1778,13 +4371,15 @@ class ProxyManagerApp(QMainWindow):
             self.clear_proxy_list()
             
             # 从数据库获取代理
-            db_proxies = self.db_manager.get_all_proxies()
+            anonymity = self.anonymity_combo.currentData()
+            db_proxies = self.db_manager.get_all_proxies(anonymity)
             for proxy in db_proxies:
                 ip, port, protocol, _ = proxy
                 self.proxy_list.append((ip, port, protocol))
                 self.proxy_listwidget.addItem(f"{ip}:{port} [{protocol}]")
             
-            self.log(f"从数据库导出了 {len(db_proxies)} 个代理")
+            level = f"{ANONYMITY_NAMES[anonymity]}" if anonymity else ""
+            self.log(f"从数据库导出了 {len(db_proxies)} 个{level}代理")
             self.update_stats()
         finally:
             self.enable_all_buttons()  # 操作完成后启用按钮
@@ -1798,6 +4393,9 @@ class ProxyManagerApp(QMainWindow):
     def update_progress(self, value):
         self.progress_bar.setValue(value)
     
+    def update_concurrency(self, value):
+        self.concurrency_label.setText(f"当前: {value}")
+    
     def verification_finished(self):
         self.log("代理验证完成")
         QMessageBox.information(self, "完成", "代理验证已完成")
@@ -1819,7 +4417,7 @@ class ProxyManagerApp(QMainWindow):
         menu = QMenu()
         
         # 根据代理类型添加不同的菜单项
-        if proxy_type == "http":
+        if proxy_type in ("http", "https"):
             set_http_proxy_action = QAction(f"设置为HTTP代理", self)
             set_http_proxy_action.triggered.connect(lambda: self.set_as_proxy(proxy_address, "http"))
             menu.addAction(set_http_proxy_action)
@@ -1873,6 +4471,9 @@ class ProxyManagerApp(QMainWindow):
             # 保存当前代理设置
             self.current_proxy = proxy_text
             self.current_proxy_type = proxy_type
+            self.reset_local_ip()
+            ip, _, port = proxy_text.rpartition(":")
+            self.db_manager.record_proxy_use(ip, int(port))
             
         except Exception as e:
             self.log(f"设置代理失败: {str(e)}")
@@ -1908,6 +4509,7 @@ class ProxyManagerApp(QMainWindow):
             # 清除当前代理设置
             self.current_proxy = None
             self.current_proxy_type = None
+            self.reset_local_ip()
             
         except Exception as e:
             self.log(f"取消代理设置失败: {str(e)}")
@@ -2065,9 +4667,13 @@ class ProxyManagerApp(QMainWindow):
         """更新统计信息"""
         total = len(self.proxy_list)
         socks5_count = sum(1 for _, _, proxy_type in self.proxy_list if proxy_type == "socks5")
-        http_count = sum(1 for _, _, proxy_type in self.proxy_list if proxy_type == "http")
+        socks4_count = sum(1 for _, _, proxy_type in self.proxy_list if proxy_type in ("socks4", "socks4a"))
+        http_count = sum(1 for _, _, proxy_type in self.proxy_list if proxy_type in ("http", "https"))
         
-        self.stats_label.setText(f"统计: {total}个代理 ({socks5_count} SOCKS5, {http_count} HTTP)")
+        stats_text = f"统计: {total}个代理 ({socks5_count} SOCKS5, {http_count} HTTP"
+        if socks4_count:
+            stats_text += f", {socks4_count} SOCKS4"
+        self.stats_label.setText(stats_text + ")")
 
     def test_selected_proxy(self):
         """测试选中的代理"""
@@ -2089,7 +4695,7 @@ class ProxyManagerApp(QMainWindow):
         ip, port = proxy_address.split(":")
         port = int(port)
         
-        self.log(f"开始测试代理 {ip}:{port} ({proxy_type})...")
+        self.log(f"开始测试代理 {ip}:{port} ({proxy_type})，总时限 {DEEP_TEST_DEADLINE} 秒...")
         
         # 创建测试线程
         test_thread = threading.Thread(target=self._test_proxy_thread, args=(ip, port, proxy_type))
@@ -2097,12 +4703,20 @@ class ProxyManagerApp(QMainWindow):
         test_thread.start()
     
     def _test_proxy_thread(self, ip, port, proxy_type):
-        """代理测试线程"""
+        """代理测试线程，各项检查同时进行，结果陆续输出，总耗时不超过 DEEP_TEST_DEADLINE 秒"""
+        deadline_at = time.monotonic() + DEEP_TEST_DEADLINE
+        
+        def remaining(timeout):
+            # 单项检查的超时不超过总时限的剩余时间
+            return max(0.1, min(timeout, deadline_at - time.monotonic()))
+        
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
         try:
             # 设置代理
+            proxy_url = ProxyVerifier.proxy_url(proxy_type, ip, port)
             proxies = {
-                'http': f'{proxy_type}://{ip}:{port}',
-                'https': f'{proxy_type}://{ip}:{port}'
+                'http': proxy_url,
+                'https': proxy_url
             }
             
             # 测试网站列表
@@ -2114,56 +4728,58 @@ class ProxyManagerApp(QMainWindow):
                 {"name": "Facebook", "url": "http://www.facebook.com", "timeout": 10}
             ]
             
-            # 测试IP泄露
-            try:
-                self.log(f"正在检查IP泄露情况...")
-                ip_check_response = requests.get("https://api.ipify.org?format=json", proxies=proxies, timeout=10)
-                if ip_check_response.status_code == 200:
-                    proxy_ip = ip_check_response.json().get("ip")
-                    self.log(f"通过代理显示的IP: {proxy_ip}")
-                    
-                    # 获取本地IP进行对比
-                    local_ip_response = requests.get("https://api.ipify.org?format=json", timeout=5)
-                    if local_ip_response.status_code == 200:
-                        local_ip = local_ip_response.json().get("ip")
-                        if proxy_ip != local_ip:
-                            self.log(f"✓ IP匿名性测试通过: 代理IP与本地IP不同")
-                        else:
-                            self.log(f"✗ IP匿名性测试失败: 代理IP与本地IP相同，可能存在IP泄露")
-            except Exception as e:
-                self.log(f"IP匿名性测试失败: {str(e)}")
-            
-            # 测试DNS泄露
-            try:
-                self.log(f"正在检查DNS泄露情况...")
-                dns_check_url = "https://www.dnsleaktest.com/json/dnsid.json"
-                dns_response = requests.get(dns_check_url, proxies=proxies, timeout=10)
-                if dns_response.status_code == 200:
-                    self.log(f"DNS泄露测试完成，请访问 https://www.dnsleaktest.com/ 查看详细结果")
-            except Exception as e:
-                self.log(f"DNS泄露测试失败: {str(e)}")
+            # IP泄露、DNS泄露和网站访问同时检查，本地IP每次运行程序只获取一次
+            self.test_log_signal.emit("正在同时检查IP泄露、DNS泄露和网站访问能力...")
+            checks = {
+                executor.submit(self.get_egress_ip, proxies, remaining(10)): {"name": "通过代理的IP"},
+                executor.submit(self.get_local_ip, remaining(5)): {"name": "本地IP"},
+                executor.submit(requests.get, "https://www.dnsleaktest.com/json/dnsid.json",
+                                proxies=proxies, timeout=remaining(10)): {"name": "DNS泄露"},
+            }
+            for site in test_sites:
+                checks[executor.submit(self.timed_get, site["url"], proxies, remaining(site["timeout"]))] = site
             
-            # 测试网站访问
-            self.log(f"开始测试网站访问能力...")
+            egress_ips = {}
             success_count = 0
-            
-            for site in test_sites:
-                try:
-                    start_time = time.time()
-                    response = requests.get(site["url"], proxies=proxies, timeout=site["timeout"])
-                    end_time = time.time()
+            try:
+                for future in concurrent.futures.as_completed(checks, timeout=max(0, deadline_at - time.monotonic())):
+                    check = checks[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if "url" in check:
+                            self.test_log_signal.emit(f"✗ 访问 {check['name']} 出错: {str(e)}")
+                        else:
+                            self.test_log_signal.emit(f"{check['name']}检查失败: {str(e)}")
+                        continue
                     
-                    if response.status_code == 200:
-                        success_count += 1
-                        self.log(f"✓ 成功访问 {site['name']}，响应时间: {(end_time - start_time):.2f}秒")
+                    if "url" in check:
+                        status_code, elapsed = result
+                        if status_code == 200:
+                            success_count += 1
+                            self.test_log_signal.emit(f"✓ 成功访问 {check['name']}，响应时间: {elapsed:.2f}秒")
+                        else:
+                            self.test_log_signal.emit(f"✗ 访问 {check['name']} 失败，状态码: {status_code}")
+                    elif check["name"] == "DNS泄露":
+                        if result.status_code == 200:
+                            self.test_log_signal.emit("DNS泄露测试完成，请访问 https://www.dnsleaktest.com/ 查看详细结果")
                     else:
-                        self.log(f"✗ 访问 {site['name']} 失败，状态码: {response.status_code}")
-                except Exception as e:
-                    self.log(f"✗ 访问 {site['name']} 出错: {str(e)}")
+                        egress_ips[check["name"]] = result
+                        if check["name"] == "通过代理的IP":
+                            self.test_log_signal.emit(f"通过代理显示的IP: {result}")
+                        # 两个IP都拿到后再对比
+                        if len(egress_ips) == 2:
+                            if egress_ips["通过代理的IP"] != egress_ips["本地IP"]:
+                                self.test_log_signal.emit("✓ IP匿名性测试通过: 代理IP与本地IP不同")
+                            else:
+                                self.test_log_signal.emit("✗ IP匿名性测试失败: 代理IP与本地IP相同，可能存在IP泄露")
+            except concurrent.futures.TimeoutError:
+                unfinished = [check["name"] for future, check in checks.items() if not future.done()]
+                self.test_log_signal.emit(f"超过 {DEEP_TEST_DEADLINE} 秒总时限，未完成的检查按失败计: {', '.join(unfinished)}")
             
             # 测试结果统计
             success_rate = (success_count / len(test_sites)) * 100
-            self.log(f"网站访问测试完成，成功率: {success_rate:.1f}%")
+            self.test_log_signal.emit(f"网站访问测试完成，成功率: {success_rate:.1f}%")
             
             # 综合评分
             if success_rate >= 80:
@@ -2175,10 +4791,45 @@ class ProxyManagerApp(QMainWindow):
             else:
                 rating = "较差"
                 
-            self.log(f"代理 {ip}:{port} ({proxy_type}) 测试完成，综合评级: {rating}")
+            self.test_log_signal.emit(f"代理 {ip}:{port} ({proxy_type}) 测试完成，综合评级: {rating}")
             
         except Exception as e:
-            self.log(f"代理测试过程中出错: {str(e)}")
+            self.test_log_signal.emit(f"代理测试过程中出错: {str(e)}")
+        finally:
+            # 超时未完成的请求在后台自行结束，不再等待
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.test_finished_signal.emit()
+    
+    @staticmethod
+    def get_egress_ip(proxies, timeout):
+        """通过代理访问 ipify，返回对方看到的出口IP，proxies 为 None 时直接访问
+        
+        不使用系统代理设置: 本程序会把代理设为系统代理，否则直接访问得到的是该代理的出口IP。
+        """
+        with requests.Session() as session:
+            session.trust_env = False
+            response = session.get("https://api.ipify.org?format=json", proxies=proxies, timeout=timeout)
+            response.raise_for_status()
+            return response.json().get("ip")
+    
+    def get_local_ip(self, timeout):
+        """本机的出口IP，获取成功后缓存，之后的测试不再重复请求"""
+        with self.local_ip_lock:
+            if self.local_ip is None:
+                self.local_ip = self.get_egress_ip(None, timeout)
+            return self.local_ip
+    
+    def reset_local_ip(self):
+        """系统代理改变后重新获取本机出口IP"""
+        with self.local_ip_lock:
+            self.local_ip = None
+    
+    @staticmethod
+    def timed_get(url, proxies, timeout):
+        """访问测试网站，返回 (状态码, 响应时间)"""
+        start_time = time.time()
+        response = requests.get(url, proxies=proxies, timeout=timeout)
+        return response.status_code, time.time() - start_time
 
     def show_source_manager(self):
         """显示代理源管理对话框"""
@@ -2195,6 +4846,17 @@ class ProxyManagerApp(QMainWindow):
             if index >= 0:
                 self.source_combo.setCurrentIndex(index)
 
+    def show_verifier_settings(self):
+        """显示验证设置对话框"""
+        dialog = VerifierSettingsDialog(self.verify_settings, self)
+        if dialog.exec_() == QDialog.Accepted:
+            settings = dialog.get_settings()
+            # 数据库中只记录了协议，测试网站或校验内容改变后之前的验证结果都不再使用
+            if any(settings[key] != self.verify_settings[key] for key in ("test_urls", "expect_token")):
+                self.verify_cache.reset()
+            self.verify_settings = settings
+            self.log(f"验证设置已更新: {self.verify_settings}")
+
     def verify_ip_locations(self):
         """验证IP地理位置"""
         if not self.proxy_list:
@@ -2314,8 +4976,234 @@ class ProxySourceManager(QDialog):
         """获取当前代理源列表"""
         return self.sources
 
+# 验证设置对话框类
+class VerifierSettingsDialog(QDialog):
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings.copy()
+        self.init_ui()
+    
+    def init_ui(self):
+        self.setWindowTitle("验证设置")
+        self.setModal(True)
+        layout = QVBoxLayout(self)
+        form_layout = QFormLayout()
+        
+        # 快速判定
+        self.quorum_checkbox = QCheckBox("并行访问测试网站，结论确定后立即取消其余请求")
+        self.quorum_checkbox.setChecked(self.settings["quorum"])
+        form_layout.addRow("快速判定:", self.quorum_checkbox)
+        
+        # 分阶段预筛选
+        self.prefilter_checkbox = QCheckBox("先做TCP连接和代理握手，通过后再访问测试网站")
+        self.prefilter_checkbox.setChecked(self.settings["prefilter"])
+        form_layout.addRow("分阶段验证:", self.prefilter_checkbox)
+        
+        self.tcp_limit_spinbox = QSpinBox()
+        self.tcp_limit_spinbox.setRange(1, 10000)
+        self.tcp_limit_spinbox.setValue(self.settings["tcp_limit"])
+        form_layout.addRow("TCP连接并发:", self.tcp_limit_spinbox)
+        
+        self.handshake_limit_spinbox = QSpinBox()
+        self.handshake_limit_spinbox.setRange(1, 10000)
+        self.handshake_limit_spinbox.setValue(self.settings["handshake_limit"])
+        form_layout.addRow("代理握手并发:", self.handshake_limit_spinbox)
+        
+        # 自动识别协议
+        self.detect_protocol_checkbox = QCheckBox("逐个识别 SOCKS5/SOCKS4/HTTP 协议并写入数据库（仅 asyncio 引擎）")
+        self.detect_protocol_checkbox.setChecked(self.settings["detect_protocol"])
+        form_layout.addRow("自动识别协议:", self.detect_protocol_checkbox)
+        
+        # 单个代理的时间预算
+        self.deadline_spinbox = QSpinBox()
+        self.deadline_spinbox.setRange(1, 120)
+        self.deadline_spinbox.setSuffix(" 秒")
+        self.deadline_spinbox.setValue(self.settings["deadline"])
+        self.deadline_spinbox.setToolTip("连接、握手和读取响应的总时间，超过后立即终止该代理的验证")
+        form_layout.addRow("单个代理时间预算:", self.deadline_spinbox)
+        
+        # 每次请求的超时，开启自适应超时时作为上限
+        self.timeout_spinbox = QDoubleSpinBox()
+        self.timeout_spinbox.setRange(0.5, 60.0)
+        self.timeout_spinbox.setSingleStep(0.5)
+        self.timeout_spinbox.setSuffix(" 秒")
+        self.timeout_spinbox.setValue(self.settings["timeout"])
+        self.timeout_spinbox.setToolTip("连接和读取每个测试网站的超时，开启自适应超时时作为上限")
+        form_layout.addRow("最长超时:", self.timeout_spinbox)
+        
+        # 自适应超时
+        self.adaptive_timeout_checkbox = QCheckBox("根据成功探测延迟的 p95 自动缩短超时（不超过最长超时）")
+        self.adaptive_timeout_checkbox.setChecked(self.settings["adaptive_timeout"])
+        form_layout.addRow("自适应超时:", self.adaptive_timeout_checkbox)
+        
+        self.timeout_factor_spinbox = QDoubleSpinBox()
+        self.timeout_factor_spinbox.setRange(1.0, 10.0)
+        self.timeout_factor_spinbox.setSingleStep(0.5)
+        self.timeout_factor_spinbox.setValue(self.settings["timeout_factor"])
+        form_layout.addRow("超时 = p95 ×", self.timeout_factor_spinbox)
+        
+        self.timeout_floor_spinbox = QDoubleSpinBox()
+        self.timeout_floor_spinbox.setRange(0.1, 5.0)
+        self.timeout_floor_spinbox.setSingleStep(0.1)
+        self.timeout_floor_spinbox.setSuffix(" 秒")
+        self.timeout_floor_spinbox.setValue(self.settings["timeout_floor"])
+        form_layout.addRow("最短超时:", self.timeout_floor_spinbox)
+        
+        # 测试地址，可换成自建的 probe_server.py 以减少流量
+        self.test_urls_edit = QTextEdit()
+        self.test_urls_edit.setPlainText("\n".join(self.settings["test_urls"]))
+        self.test_urls_edit.setFixedHeight(100)
+        self.test_urls_edit.setToolTip("每行一个 http:// 地址（不支持 https），例如 http://你的服务器:8204/generate_204")
+        form_layout.addRow("测试地址:", self.test_urls_edit)
+        
+        self.expect_token_edit = QLineEdit(self.settings["expect_token"])
+        self.expect_token_edit.setPlaceholderText("留空则只检查状态码")
+        form_layout.addRow("响应标记:", self.expect_token_edit)
+        
+        self.max_body_spinbox = QSpinBox()
+        self.max_body_spinbox.setRange(0, 1024 * 1024)
+        self.max_body_spinbox.setSuffix(" 字节")
+        self.max_body_spinbox.setValue(self.settings["max_body_bytes"])
+        form_layout.addRow("最多读取响应体:", self.max_body_spinbox)
+        
+        self.circuit_breaker_checkbox = QCheckBox("测试网站大面积失败时暂时停用，冷却后再试")
+        self.circuit_breaker_checkbox.setChecked(self.settings["circuit_breaker"])
+        form_layout.addRow("测试网站熔断:", self.circuit_breaker_checkbox)
+        
+        self.auto_concurrency_checkbox = QCheckBox("根据超时率和吞吐量自动调整，验证并发数作为上限")
+        self.auto_concurrency_checkbox.setChecked(self.settings["auto_concurrency"])
+        form_layout.addRow("自动调节并发:", self.auto_concurrency_checkbox)
+        
+        self.cache_good_ttl_spinbox = QSpinBox()
+        self.cache_good_ttl_spinbox.setRange(0, 24 * 60)
+        self.cache_good_ttl_spinbox.setSuffix(" 分钟")
+        self.cache_good_ttl_spinbox.setValue(self.settings["cache_good_ttl"])
+        self.cache_good_ttl_spinbox.setToolTip("在此时间内验证为有效的代理不再重复验证，0 表示不跳过")
+        form_layout.addRow("有效结果缓存:", self.cache_good_ttl_spinbox)
+        
+        self.cache_dead_ttl_spinbox = QSpinBox()
+        self.cache_dead_ttl_spinbox.setRange(0, 7 * 24 * 60)
+        self.cache_dead_ttl_spinbox.setSuffix(" 分钟")
+        self.cache_dead_ttl_spinbox.setValue(self.settings["cache_dead_ttl"])
+        self.cache_dead_ttl_spinbox.setToolTip("在此时间内验证为无效的代理不再重复验证，0 表示不跳过")
+        form_layout.addRow("无效结果缓存:", self.cache_dead_ttl_spinbox)
+        
+        self.anonymity_url_edit = QLineEdit(self.settings["anonymity_url"])
+        self.anonymity_url_edit.setPlaceholderText("http://你的服务器:8204/headers")
+        self.anonymity_url_edit.setToolTip("检测匿名级别时访问的请求头回显地址，可运行 probe_server.py 提供")
+        form_layout.addRow("请求头回显地址:", self.anonymity_url_edit)
+        
+        self.connect_target_edit = QLineEdit(self.settings["connect_target"])
+        self.connect_target_edit.setPlaceholderText(DEFAULT_CONNECT_TARGET)
+        self.connect_target_edit.setToolTip("识别协议时通过 CONNECT 连接的 TLS 网站（主机:端口），能建立隧道的 HTTP 代理识别为 https")
+        form_layout.addRow("CONNECT 目标:", self.connect_target_edit)
+        
+        self.processes_spinbox = QSpinBox()
+        self.processes_spinbox.setRange(1, 256)
+        self.processes_spinbox.setValue(self.settings["processes"])
+        self.processes_spinbox.setToolTip("processes 引擎使用的进程数，默认等于CPU核数")
+        form_layout.addRow("验证进程数:", self.processes_spinbox)
+        
+        # distributed 引擎
+        self.coordinator_host_edit = QLineEdit(self.settings["coordinator_host"])
+        self.coordinator_host_edit.setToolTip("需要其他主机加入时改为 0.0.0.0")
+        form_layout.addRow("协调节点地址:", self.coordinator_host_edit)
+        
+        self.coordinator_port_spinbox = QSpinBox()
+        self.coordinator_port_spinbox.setRange(1, 65535)
+        self.coordinator_port_spinbox.setValue(self.settings["coordinator_port"])
+        form_layout.addRow("协调节点端口:", self.coordinator_port_spinbox)
+        
+        self.local_workers_spinbox = QSpinBox()
+        self.local_workers_spinbox.setRange(0, 64)
+        self.local_workers_spinbox.setValue(self.settings["local_workers"])
+        form_layout.addRow("本地工作进程数:", self.local_workers_spinbox)
+        
+        self.worker_token_edit = QLineEdit(self.settings["worker_token"])
+        self.worker_token_edit.setPlaceholderText("协调节点地址不是本机回环地址时必填，工作节点需用 --token 提供相同的口令")
+        form_layout.addRow("工作节点口令:", self.worker_token_edit)
+        
+        layout.addLayout(form_layout)
+        
+        # 确定和取消按钮
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.Ok | QDialogButtonBox.Cancel,
+            Qt.Horizontal, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+    
+    def accept(self):
+        """设置有误时提示并保留对话框"""
+        error = self.validation_error()
+        if error:
+            QMessageBox.warning(self, "警告", error)
+            return
+        super().accept()
+    
+    def validation_error(self):
+        """检查填写的设置，返回错误说明，没有错误时返回 None"""
+        # 异步引擎直接在套接字上发送明文 HTTP 请求，不支持 TLS，https 地址会被当作 80 端口的明文请求
+        urls = [line.strip() for line in self.test_urls_edit.toPlainText().splitlines() if line.strip()]
+        if self.anonymity_url_edit.text().strip():
+            urls.append(self.anonymity_url_edit.text().strip())
+        for url in urls:
+            parts = urlsplit(url)
+            if parts.scheme != "http" or not parts.hostname:
+                return f"地址 {url} 无效，测试地址和请求头回显地址只支持 http:// 开头的地址"
+        connect_target = self.connect_target_edit.text().strip() or DEFAULT_CONNECT_TARGET
+        host, _, port = connect_target.rpartition(":")
+        if not host or not port.isdigit() or not 0 < int(port) < 65536:
+            return f"CONNECT 目标 {connect_target} 无效，应为 主机:端口，例如 {DEFAULT_CONNECT_TARGET}"
+        host = self.coordinator_host_edit.text().strip() or "127.0.0.1"
+        if not self.worker_token_edit.text().strip() and not is_loopback_host(host):
+            return f"协调节点地址 {host} 可从其他主机访问，请设置工作节点口令"
+        return None
+    
+    def get_settings(self):
+        """获取修改后的验证设置"""
+        self.settings["quorum"] = self.quorum_checkbox.isChecked()
+        self.settings["prefilter"] = self.prefilter_checkbox.isChecked()
+        self.settings["tcp_limit"] = self.tcp_limit_spinbox.value()
+        self.settings["handshake_limit"] = self.handshake_limit_spinbox.value()
+        self.settings["detect_protocol"] = self.detect_protocol_checkbox.isChecked()
+        self.settings["deadline"] = self.deadline_spinbox.value()
+        self.settings["timeout"] = self.timeout_spinbox.value()
+        self.settings["adaptive_timeout"] = self.adaptive_timeout_checkbox.isChecked()
+        self.settings["timeout_factor"] = self.timeout_factor_spinbox.value()
+        # 最短超时不能超过最长超时
+        self.settings["timeout_floor"] = min(self.timeout_floor_spinbox.value(), self.settings["timeout"])
+        test_urls = [line.strip() for line in self.test_urls_edit.toPlainText().splitlines() if line.strip()]
+        self.settings["test_urls"] = test_urls or list(DEFAULT_TEST_URLS)
+        self.settings["expect_token"] = self.expect_token_edit.text().strip()
+        self.settings["max_body_bytes"] = self.max_body_spinbox.value()
+        self.settings["circuit_breaker"] = self.circuit_breaker_checkbox.isChecked()
+        self.settings["auto_concurrency"] = self.auto_concurrency_checkbox.isChecked()
+        self.settings["cache_good_ttl"] = self.cache_good_ttl_spinbox.value()
+        self.settings["cache_dead_ttl"] = self.cache_dead_ttl_spinbox.value()
+        self.settings["anonymity_url"] = self.anonymity_url_edit.text().strip()
+        self.settings["connect_target"] = self.connect_target_edit.text().strip() or DEFAULT_CONNECT_TARGET
+        self.settings["processes"] = self.processes_spinbox.value()
+        self.settings["coordinator_host"] = self.coordinator_host_edit.text().strip() or "127.0.0.1"
+        self.settings["coordinator_port"] = self.coordinator_port_spinbox.value()
+        self.settings["local_workers"] = self.local_workers_spinbox.value()
+        self.settings["worker_token"] = self.worker_token_edit.text().strip()
+        return self.settings
+
 # 程序入口
 if __name__ == "__main__":
+    # 打包后的程序启动 processes 引擎的工作进程时需要
+    multiprocessing.freeze_support()
+    
+    # python proxy_manager.py --worker http://协调节点:8765 以工作节点方式运行，不启动界面
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--worker")
+    parser.add_argument("--token", default="")
+    args, _ = parser.parse_known_args()
+    if args.worker:
+        run_worker(args.worker.rstrip("/"), args.token)
+        sys.exit(0)
+    
     app = QApplication(sys.argv)
     window = ProxyManagerApp()
     sys.exit(app.exec_()) 
\ No newline at end of file